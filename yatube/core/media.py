@@ -0,0 +1,127 @@
+"""Отдача файлов из MEDIA_ROOT.
+
+Представление только проверяет путь и заголовки, а байты отдаёт
+фронт-сервер: nginx по X-Accel-Redirect или Apache/lighttpd по
+X-Sendfile (MEDIA_ACCEL). Без фронт-сервера ответом служит FileResponse,
+который WSGI-сервер может отправить через sendfile; запрос Range
+отдаётся частичным ответом. Имена картинок и миниатюр не меняются при
+правке содержимого, поэтому кэшировать их можно надолго.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FileRange:
+    """Файл, из которого можно прочитать только length байт от start."""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def resolve(path):
+    """Имя внутри MEDIA_ROOT или 404 для чужих и подозрительных путей."""
+    name = posixpath.normpath(path).lstrip('/')
+    if (name.startswith('..') or '\\' in name
+            or not name.startswith(settings.MEDIA_SERVE_PREFIXES)):
+        raise Http404
+    full_path = os.path.join(settings.MEDIA_ROOT, *name.split('/'))
+    if not os.path.isfile(full_path):
+        raise Http404
+    return name, full_path
+
+
+def parse_range(header, size):
+    """(start, length) для одного диапазона, None — отдать файл целиком.
+
+    ValueError означает, что диапазон за пределами файла (416).
+    """
+    match = RANGE_RE.match(header)
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        start = max(size - int(last), 0)
+        end = size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end - start + 1
+
+
+def accel_response(name, full_path):
+    response = HttpResponse()
+    if settings.MEDIA_ACCEL == 'nginx':
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + name
+    else:
+        response['X-Sendfile'] = full_path
+    # Тип и длину проставит фронт-сервер.
+    del response['Content-Type']
+    return response
+
+
+def file_response(request, full_path, size, etag):
+    byte_range = None
+    header = request.META.get('HTTP_RANGE')
+    if header and request.META.get('HTTP_IF_RANGE', etag) == etag:
+        try:
+            byte_range = parse_range(header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    if byte_range is None:
+        response = FileResponse(open(full_path, 'rb'))
+    else:
+        start, length = byte_range
+        content_type = mimetypes.guess_type(full_path)[0]
+        response = FileResponse(
+            FileRange(open(full_path, 'rb'), start, length), status=206,
+            content_type=content_type or 'application/octet-stream')
+        response['Content-Length'] = length
+        response['Content-Range'] = (
+            f'bytes {start}-{start + length - 1}/{size}')
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+@require_safe
+def serve(request, path):
+    name, full_path = resolve(path)
+    stat = os.stat(full_path)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        if settings.MEDIA_ACCEL:
+            response = accel_response(name, full_path)
+        else:
+            response = file_response(request, full_path, stat.st_size, etag)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = (
+        f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}, immutable')
+    return response
@@ -0,0 +1,29 @@
+from django import template
+from django.conf import settings
+
+register = template.Library()
+
+
+@register.filter
+def page_window(page_obj, on_each_side=None):
+    """Номера страниц: первая, последняя и несколько вокруг текущей.
+
+    Пропуски обозначены None, поэтому размер списка не зависит от
+    общего числа страниц.
+    """
+    if on_each_side is None:
+        on_each_side = settings.PAGINATOR_ON_EACH_SIDE
+    num_pages = page_obj.paginator.num_pages
+    start = max(page_obj.number - on_each_side, 1)
+    end = min(page_obj.number + on_each_side, num_pages)
+    window = []
+    if start > 1:
+        window.append(1)
+        if start > 2:
+            window.append(None)
+    window.extend(range(start, end + 1))
+    if end < num_pages:
+        if end < num_pages - 1:
+            window.append(None)
+        window.append(num_pages)
+    return window
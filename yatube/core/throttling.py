@@ -0,0 +1,92 @@
+"""Ограничение частоты записей: ведро токенов на пользователя и на IP.
+
+Ведро хранится в кэше как одно целое число — теоретическое время
+прихода следующего запроса в миллисекундах (GCRA, эквивалент ведра
+токенов). Каждый запрос атомарно сдвигает его через cache.incr на
+интервал между токенами; если время ушло дальше, чем на ёмкость ведра
+вперёд, запрос отклоняется, а сдвиг откатывается. Ёмкость и время
+полного наполнения задаются в THROTTLE_RATES по имени области.
+"""
+import math
+import time
+from functools import wraps
+from http import HTTPStatus
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+KEY = 'throttle:{}:{}:{}'
+
+
+def _now():
+    # Время стены, а не monotonic: ведро делят все процессы.
+    return int(time.time() * 1000)
+
+
+def take(key, capacity, period):
+    """Берёт токен из ведра key.
+
+    capacity токенов наполняются за period секунд. Возвращает 0, если
+    токен взят, иначе — через сколько секунд повторить запрос.
+    """
+    interval = period * 1000 // capacity
+    timeout = period + 1
+    now = _now()
+    if cache.add(key, now + interval, timeout):
+        return 0
+    try:
+        arrival = cache.incr(key, interval)
+    except ValueError:
+        # Ключ истёк между add и incr: ведро снова полное.
+        cache.set(key, now + interval, timeout)
+        return 0
+    if arrival - interval < now:
+        # Ведро простаивало и полно: отсчёт начинается с текущего момента.
+        cache.set(key, now + interval, timeout)
+        return 0
+    excess = arrival - now - capacity * interval
+    if excess > 0:
+        cache.decr(key, interval)
+        return math.ceil(excess / 1000)
+    cache.touch(key, timeout)
+    return 0
+
+
+def too_many_requests(retry_after):
+    response = HttpResponse(
+        'Слишком много запросов, попробуйте позже',
+        status=HTTPStatus.TOO_MANY_REQUESTS,
+        content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def throttle(scope, methods=('POST',)):
+    """429 с Retry-After, когда у IP или пользователя кончились токены.
+
+    Лимиты области scope берутся из THROTTLE_RATES; области без записи
+    не ограничены. Проверяются только запросы методов methods.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            rates = settings.THROTTLE_RATES.get(scope, {})
+            if request.method in methods:
+                buckets = [('ip', client_ip(request))]
+                if request.user.is_authenticated:
+                    buckets.append(('user', request.user.pk))
+                for kind, ident in buckets:
+                    if kind not in rates:
+                        continue
+                    retry_after = take(
+                        KEY.format(scope, kind, ident), *rates[kind])
+                    if retry_after:
+                        return too_many_requests(retry_after)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,264 @@
+"""JSON API лент и постов.
+
+Те же queryset, что и у HTML-страниц, курсорная пагинация (?after=,
+?before=), выбор полей (?fields=id,text) и ETag по поколению контента.
+Единственная запись — пакетная подписка follow_bulk.
+
+Для опроса «есть ли новые посты» у лент есть адреса .../new/?since=:
+они сравнивают курсор клиента с самым новым постом ленты, который
+хранится в кэше до смены поколения, и идут в базу, только когда новые
+посты действительно есть.
+"""
+import hashlib
+import json
+from http import HTTPStatus
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponseNotModified, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import (
+    condition, require_GET, require_POST)
+
+from core.throttling import throttle
+
+from . import follows, timeline
+from .caching import current_generation, generation_etag, shared_etag
+from .models import Group, Post
+from .utils import CursorPaginator, decode_cursor
+
+User = get_user_model()
+
+POST_FIELDS = {
+    'id': lambda post: post.pk,
+    'text': lambda post: post.text,
+    'pub_date': lambda post: post.pub_date.isoformat(),
+    'author': lambda post: post.author.username,
+    'group': lambda post: post.group.slug if post.group_id else None,
+    'image': lambda post: post.image.url if post.image else None,
+    'image_width': lambda post: post.image_width,
+    'image_height': lambda post: post.image_height,
+    'image_color': lambda post: post.image_color or None,
+    'comments_count': lambda post: post.comments_count,
+}
+
+COMMENT_FIELDS = {
+    'id': lambda comment: comment.pk,
+    'text': lambda comment: comment.text,
+    'created': lambda comment: comment.created.isoformat(),
+    'author': lambda comment: comment.author.username,
+}
+
+
+class FieldsError(ValueError):
+    pass
+
+
+def _json(data, status=HTTPStatus.OK):
+    return JsonResponse(
+        data, status=status,
+        json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False},
+    )
+
+
+def _select(request, available, param='fields'):
+    """Поля из ?fields=a,b; без параметра — все."""
+    raw = request.GET.get(param)
+    if not raw:
+        return list(available)
+    names = [name for name in raw.split(',') if name]
+    unknown = set(names) - set(available)
+    if unknown:
+        raise FieldsError(
+            f'Неизвестные поля в {param}: {", ".join(sorted(unknown))}')
+    return names
+
+
+def _serialize(obj, fields, available):
+    return {name: available[name](obj) for name in fields}
+
+
+def _page(request, queryset, fields, available, keys=('pub_date', 'pk'),
+          per_page=None):
+    paginator = CursorPaginator(
+        queryset, per_page or settings.COUNT_POSTS, keys)
+    page = paginator.get_page(
+        after=request.GET.get('after'), before=request.GET.get('before'))
+    return {
+        'results': [_serialize(obj, fields, available) for obj in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }
+
+
+def api_view(view, etag_func=generation_etag):
+    """GET, ETag по поколению и ответ 400 на неизвестные поля."""
+    @require_GET
+    @condition(etag_func=etag_func)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except FieldsError as error:
+            return _json({'detail': str(error)}, HTTPStatus.BAD_REQUEST)
+    return wrapper
+
+
+def shared_api_view(view):
+    """api_view для ответов, одинаковых для всех: пустой опрос из вкладки
+    с входом не читает ни сессию, ни пользователя."""
+    return api_view(view, shared_etag)
+
+
+def _feed(request, posts, keys=('pub_date', 'pk')):
+    fields = _select(request, POST_FIELDS)
+    return _json(_page(request, posts, fields, POST_FIELDS, keys))
+
+
+def _newest(feed, posts, keys):
+    """(дата, id) самого нового поста ленты; кэшируется на поколение."""
+    key = f'posts:newest:{current_generation()}:{feed}'
+    newest = cache.get(key)
+    if newest is None:
+        date_key, id_key = keys
+        newest = posts.order_by(f'-{date_key}', f'-{id_key}').values_list(
+            date_key, id_key).first() or ()
+        cache.set(key, newest, settings.FEED_CACHE_TIMEOUT)
+    return tuple(newest)
+
+
+def _new_posts(request, feed, posts, keys=('pub_date', 'pk')):
+    """Число постов новее ?since (не больше NEW_POSTS_LIMIT) или 304."""
+    token = request.GET.get('since', '')
+    since = decode_cursor(token)
+    if since is None:
+        return _json({'detail': 'Нужен курсор since'},
+                     HTTPStatus.BAD_REQUEST)
+    newest = _newest(feed, posts, keys)
+    if not newest or newest <= since:
+        return HttpResponseNotModified()
+    key = 'posts:new_count:{}:{}:{}'.format(
+        current_generation(), feed, hashlib.md5(token.encode()).hexdigest())
+    count = cache.get(key)
+    if count is None:
+        date_key, _ = keys
+        # Отдельное условие >= по дате даёт поиск по диапазону индекса.
+        newer = posts.filter(**{f'{date_key}__gte': since[0]}).filter(
+            CursorPaginator(posts, 1, keys).key_filter(*since, 'gt'))
+        count = newer[:settings.NEW_POSTS_LIMIT].count()
+        cache.set(key, count, settings.FEED_CACHE_TIMEOUT)
+    return _json({'count': count, 'limit': settings.NEW_POSTS_LIMIT})
+
+
+@api_view
+def index(request):
+    return _feed(request, Post.objects.select_related('author', 'group'))
+
+
+@api_view
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return _feed(request, group.posts.select_related('author', 'group'))
+
+
+@api_view
+def profile(request, username):
+    author = get_object_or_404(User, username=username)
+    return _feed(request, author.posts.select_related('author', 'group'))
+
+
+@api_view
+def follow_index(request):
+    if not request.user.is_authenticated:
+        return _json({'detail': 'Требуется авторизация'},
+                     HTTPStatus.UNAUTHORIZED)
+    posts = timeline.feed_for(request.user).select_related('author', 'group')
+    return _feed(request, posts, timeline.CURSOR_KEYS)
+
+
+@shared_api_view
+def index_new(request):
+    return _new_posts(request, 'index', Post.objects.all())
+
+
+@shared_api_view
+def group_new(request, slug):
+    # Без поиска группы: неизвестный slug просто никогда не даст новых
+    # постов, а опрос не тратит запрос на каждый вызов.
+    return _new_posts(
+        request, f'group:{slug}', Post.objects.filter(group__slug=slug))
+
+
+@api_view
+def follow_new(request):
+    if not request.user.is_authenticated:
+        return _json({'detail': 'Требуется авторизация'},
+                     HTTPStatus.UNAUTHORIZED)
+    return _new_posts(
+        request, f'follow:{request.user.pk}',
+        timeline.feed_for(request.user), timeline.CURSOR_KEYS)
+
+
+@api_view
+def post_detail(request, post_id):
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), pk=post_id)
+    fields = _select(request, POST_FIELDS)
+    comment_fields = _select(request, COMMENT_FIELDS, 'comment_fields')
+    data = _serialize(post, fields, POST_FIELDS)
+    data['comments'] = _page(
+        request, post.comments.select_related('author'),
+        comment_fields, COMMENT_FIELDS, ('created', 'pk'),
+        settings.COUNT_COMMENTS)
+    return _json(data)
+
+
+@api_view
+def post_comments(request, post_id):
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    fields = _select(request, COMMENT_FIELDS)
+    return _json(_page(
+        request, post.comments.select_related('author'),
+        fields, COMMENT_FIELDS, ('created', 'pk'), settings.COUNT_COMMENTS))
+
+
+def _usernames(payload, key):
+    names = payload.get(key, [])
+    if not isinstance(names, list) or not all(
+            isinstance(name, str) for name in names):
+        raise ValueError(f'{key} должен быть списком имён')
+    return names
+
+
+@require_POST
+@throttle('follow_bulk')
+@transaction.atomic
+def follow_bulk(request):
+    """Подписка и отписка списком: {"follow": [...], "unfollow": [...]}."""
+    if not request.user.is_authenticated:
+        return _json({'detail': 'Требуется авторизация'},
+                     HTTPStatus.UNAUTHORIZED)
+    try:
+        payload = json.loads(request.body)
+        if not isinstance(payload, dict):
+            raise ValueError('Ожидается объект')
+        follow = _usernames(payload, 'follow')
+        unfollow = _usernames(payload, 'unfollow')
+    except ValueError as error:
+        return _json({'detail': str(error)}, HTTPStatus.BAD_REQUEST)
+    if len(follow) + len(unfollow) > settings.FOLLOW_BULK_LIMIT:
+        return _json(
+            {'detail': f'Не больше {settings.FOLLOW_BULK_LIMIT} имён'},
+            HTTPStatus.BAD_REQUEST)
+    ids = dict(User.objects.filter(
+        username__in=set(follow) | set(unfollow),
+    ).values_list('username', 'pk'))
+    user_id = request.user.pk
+    return _json({
+        'followed': follows.follow_many(
+            (user_id, ids[name]) for name in follow if name in ids),
+        'unfollowed': follows.unfollow_many(
+            (user_id, ids[name]) for name in unfollow if name in ids),
+        'unknown': sorted((set(follow) | set(unfollow)) - set(ids)),
+    })
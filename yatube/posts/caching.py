@@ -0,0 +1,69 @@
+"""Кэш страниц с инвалидацией по поколению контента.
+
+Ключ закэшированной страницы включает номер поколения. Сигналы
+сохранения и удаления постов, комментариев, групп и подписок
+увеличивают его, поэтому все старые ключи разом становятся
+недостижимыми, а страницы можно хранить долго.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.views.decorators.cache import cache_page
+from django.views.decorators.vary import vary_on_cookie
+
+GENERATION_KEY = 'posts:generation'
+
+
+def _initial_generation():
+    # Если счётчик вытеснят из кэша, новое поколение начнётся с текущего
+    # времени в микросекундах и не совпадёт с уже использованными.
+    return int(time.time() * 1_000_000)
+
+
+def current_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, _initial_generation(), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, _initial_generation(), timeout=None)
+
+
+def cache_page_by_generation(view):
+    """cache_page, ключ которого меняется вместе с поколением.
+
+    Страница зависит от сессии (шапка, кнопка подписки), поэтому
+    Vary: Cookie выставляется до того, как ответ попадёт в кэш.
+    """
+    view = vary_on_cookie(view)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        cached_view = cache_page(
+            settings.FEED_CACHE_TIMEOUT,
+            key_prefix=f'gen{current_generation()}',
+        )(view)
+        return cached_view(request, *args, **kwargs)
+    return wrapper
+
+
+def generation_etag(request, *args, **kwargs):
+    """ETag по поколению контента, пользователю и адресу запроса."""
+    raw = f'{current_generation()}|{request.user.pk}|{request.get_full_path()}'
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def shared_etag(request, *args, **kwargs):
+    """ETag по поколению и адресу: ответ одинаков для всех, и request.user
+    (а с ним сессия) не загружается."""
+    raw = f'{current_generation()}|{request.get_full_path()}'
+    return hashlib.md5(raw.encode()).hexdigest()
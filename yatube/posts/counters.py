@@ -0,0 +1,111 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются атомарным UPDATE ... SET n = n + delta в той же
+транзакции, что и запись, которая их изменила. Расхождения (например,
+после bulk_create или правки базы вручную) исправляет команда
+reconcile_counters.
+"""
+from django.db.models import Count, F
+
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+def _shift(queryset, **deltas):
+    # Уменьшение не уводит счётчик ниже нуля: при расхождении строка
+    # просто не обновится, а поправит её reconcile_counters.
+    for field, delta in deltas.items():
+        if delta < 0:
+            queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{
+        field: F(field) + delta for field, delta in deltas.items()
+    })
+
+
+def shift_user(user_id, **deltas):
+    # Строки UserStats создаются при первом чтении (stats_for), поэтому
+    # здесь её может ещё не быть — тогда и менять нечего.
+    _shift(UserStats.objects.filter(user_id=user_id), **deltas)
+
+
+def shift_group(group_id, delta):
+    if group_id is not None:
+        _shift(Group.objects.filter(pk=group_id), posts_count=delta)
+
+
+def shift_post(post_id, delta):
+    _shift(Post.objects.filter(pk=post_id), comments_count=delta)
+
+
+def stats_for(user):
+    """Счётчики пользователя; недостающая строка создаётся по факту."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        recount_users([user.pk])
+        return UserStats.objects.get(user_id=user.pk)
+
+
+def _counts(queryset, field):
+    return dict(
+        queryset.values(field).annotate(n=Count('pk')).values_list(
+            field, 'n').order_by()
+    )
+
+
+def recount_users(user_ids):
+    """Пересчитывает счётчики пользователей, возвращает число исправленных."""
+    user_ids = list(user_ids)
+    posts = _counts(Post.objects.filter(author_id__in=user_ids), 'author_id')
+    followers = _counts(
+        Follow.objects.filter(author_id__in=user_ids), 'author_id')
+    following = _counts(Follow.objects.filter(user_id__in=user_ids), 'user_id')
+    existing = UserStats.objects.in_bulk(user_ids)
+    changed, missing = [], []
+    for user_id in user_ids:
+        actual = {
+            'posts_count': posts.get(user_id, 0),
+            'followers_count': followers.get(user_id, 0),
+            'following_count': following.get(user_id, 0),
+        }
+        stats = existing.get(user_id)
+        if stats is None:
+            missing.append(UserStats(user_id=user_id, **actual))
+        elif any(getattr(stats, k) != v for k, v in actual.items()):
+            for field, value in actual.items():
+                setattr(stats, field, value)
+            changed.append(stats)
+    UserStats.objects.bulk_create(missing, ignore_conflicts=True)
+    UserStats.objects.bulk_update(
+        changed, ['posts_count', 'followers_count', 'following_count'])
+    return len(changed) + len(missing)
+
+
+def recount_groups(group_ids):
+    group_ids = list(group_ids)
+    posts = _counts(Post.objects.filter(group_id__in=group_ids), 'group_id')
+    changed = []
+    for group in Group.objects.filter(pk__in=group_ids).only('posts_count'):
+        if group.posts_count != posts.get(group.pk, 0):
+            group.posts_count = posts.get(group.pk, 0)
+            changed.append(group)
+    Group.objects.bulk_update(changed, ['posts_count'])
+    return len(changed)
+
+
+def recount_posts(post_ids):
+    post_ids = list(post_ids)
+    comments = _counts(Comment.objects.filter(post_id__in=post_ids), 'post_id')
+    changed = []
+    for post in Post.objects.filter(pk__in=post_ids).only('comments_count'):
+        if post.comments_count != comments.get(post.pk, 0):
+            post.comments_count = comments.get(post.pk, 0)
+            changed.append(post)
+    Post.objects.bulk_update(changed, ['comments_count'])
+    return len(changed)
+
+
+RECOUNTERS = (
+    (User, recount_users),
+    (Group, recount_groups),
+    (Post, recount_posts),
+)
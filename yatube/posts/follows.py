@@ -0,0 +1,72 @@
+"""Пакетные подписки и отписки.
+
+Одиночные подписки идут через модель Follow, и сигналы обновляют ленты
+и счётчики на каждую запись. Здесь пачка рёбер (user_id, author_id)
+пишется одним bulk_create или DELETE, а ленты, счётчики, поколение кэша
+и отметки freshness обновляются один раз на пачку.
+"""
+from django.db import connection, transaction
+
+from . import counters, freshness, graph, timeline
+from .caching import bump_generation
+from .models import Follow
+
+
+def _existing(edges):
+    users = {user_id for user_id, _ in edges}
+    authors = {author_id for _, author_id in edges}
+    return set(Follow.objects.filter(
+        user_id__in=users, author_id__in=authors,
+    ).values_list('user_id', 'author_id'))
+
+
+def _changed(edges):
+    """Пересчёт производного состояния после записи пачки."""
+    user_ids = {user_id for edge in edges for user_id in edge}
+    counters.recount_users(user_ids)
+    bump_generation()
+    freshness.touch(*(f'author:{user_id}' for user_id in user_ids))
+
+
+@transaction.atomic
+def follow_many(edges):
+    """Создаёт подписки, которых ещё нет; возвращает число новых."""
+    edges = {(user_id, author_id) for user_id, author_id in edges
+             if user_id != author_id}
+    new = edges - _existing(edges)
+    if not new:
+        return 0
+    Follow.objects.bulk_create(
+        [Follow(user_id=user_id, author_id=author_id)
+         for user_id, author_id in new],
+        ignore_conflicts=True)
+    timeline.backfill_many(new)
+    graph.update(added=new)
+    _changed(new)
+    return len(new)
+
+
+@transaction.atomic
+def unfollow_many(edges):
+    """Удаляет подписки; возвращает число удалённых."""
+    edges = set(edges)
+    gone = edges & _existing(edges)
+    if not gone:
+        return 0
+    authors = {}
+    for user_id, author_id in gone:
+        authors.setdefault(user_id, []).append(author_id)
+    # Прямой DELETE, без сигналов post_delete на каждую строку: ленты
+    # и счётчики обновятся ниже, один раз на пачку.
+    table = connection.ops.quote_name(Follow._meta.db_table)
+    with connection.cursor() as cursor:
+        for user_id, author_ids in authors.items():
+            placeholders = ', '.join(['%s'] * len(author_ids))
+            cursor.execute(
+                f'DELETE FROM {table} WHERE user_id = %s '
+                f'AND author_id IN ({placeholders})',
+                [user_id, *author_ids])
+    timeline.prune_many(gone)
+    graph.update(removed=gone)
+    _changed(gone)
+    return len(gone)
@@ -8,6 +8,19 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def __init__(self, *args, upload_errors=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upload_errors = upload_errors or {}
+
+    def clean(self):
+        # Файл, отброшенный при загрузке (см. uploads), в FILES не попал;
+        # без этого пост молча сохранился бы без картинки.
+        cleaned_data = super().clean()
+        for field, message in self.upload_errors.items():
+            if field in self.fields:
+                self.add_error(field, message)
+        return cleaned_data
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
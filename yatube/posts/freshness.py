@@ -0,0 +1,110 @@
+"""Валидаторы условных GET-запросов (ETag / Last-Modified).
+
+Сигналы записывают в кэш отметку времени последнего изменения для
+поста, автора и группы по первичному ключу: так ключи кэша остаются
+ASCII, а сигналам не нужно читать связанные объекты. Представление
+отвечает 304 после одного запроса по индексу (id поста, username
+автора или slug группы из URL), до рендера шаблона.
+"""
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+from django.views.decorators.http import condition
+
+from .models import Group, Post, User
+
+STAMP_KEY = 'posts:stamp:{}'
+
+
+def touch(*names):
+    """Отмечает, что объекты с этими именами изменились сейчас."""
+    now = time.time()
+    cache.set_many(
+        {STAMP_KEY.format(name): now for name in names}, timeout=None)
+
+
+def last_change(names):
+    keys = [STAMP_KEY.format(name) for name in names]
+    stamps = cache.get_many(keys)
+    # Неизвестную отметку считаем свежей: лишний полный ответ безопасен,
+    # лишний 304 — нет.
+    missing = {key: time.time() for key in keys if key not in stamps}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        stamps.update(missing)
+    return max(stamps.values())
+
+
+def _post_names(post_id):
+    row = Post.objects.filter(pk=post_id).values_list(
+        'author_id', 'group_id').first()
+    if row is None:
+        return None
+    author_id, group_id = row
+    names = [f'post:{post_id}', f'author:{author_id}']
+    # Страница поста показывает название группы.
+    if group_id is not None:
+        names.append(f'group:{group_id}')
+    return names
+
+
+def _profile_names(username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True).first()
+    return None if author_id is None else [f'author:{author_id}']
+
+
+def _group_names(slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True).first()
+    return None if group_id is None else [f'group:{group_id}']
+
+
+def _conditional(resolve_names, csrf=False):
+    """condition() с валидаторами по отметкам объектов из URL.
+
+    Отметка вычисляется один раз на запрос. Если объекта нет, валидаторов
+    нет, и представление само вернёт 404. csrf=True — для страниц
+    с формой: ETag зависит и от CSRF-токена, который меняется при входе,
+    чтобы браузер не отправил форму из закэшированной копии со старым.
+    """
+    def stamp(request, *args, **kwargs):
+        if not hasattr(request, '_freshness_stamp'):
+            names = resolve_names(*args, **kwargs)
+            request._freshness_stamp = (
+                None if names is None else last_change(names))
+        return request._freshness_stamp
+
+    def etag(request, *args, **kwargs):
+        value = stamp(request, *args, **kwargs)
+        if value is None:
+            return None
+        raw = f'{value}|{request.user.pk}|{request.get_full_path()}'
+        if csrf and request.user.is_authenticated:
+            # get_token создаёт токен, если его ещё нет, — тот же, что
+            # попадёт в форму и в куку ответа.
+            get_token(request)
+            raw += '|' + request.META['CSRF_COOKIE']
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        # Last-Modified не зависит ни от пользователя, ни от CSRF-токена,
+        # поэтому он только у анонимных ответов.
+        if request.user.is_authenticated:
+            return None
+        value = stamp(request, *args, **kwargs)
+        # Заголовок точен до секунды: пока секунда отметки не прошла,
+        # изменение в ту же секунду получило бы 304.
+        if value is None or time.time() < int(value) + 1:
+            return None
+        return datetime.fromtimestamp(int(value), tz=timezone.utc)
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+post_condition = _conditional(_post_names, csrf=True)
+profile_condition = _conditional(_profile_names)
+group_condition = _conditional(_group_names)
@@ -0,0 +1,85 @@
+"""Граф подписок в кэше.
+
+Для каждого читателя в кэше лежит отсортированный массив id авторов
+(array('I'), по 4 байта на подписку). Проверка «подписан ли», список
+и число подписок отвечают по нему без запросов к базе, а отсутствующий
+массив собирается одним запросом при первом чтении. Подписки и отписки
+правят массив после фиксации транзакции; ограниченный срок жизни
+в кэше исправляет редкие потерянные обновления.
+"""
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Follow
+
+KEY = 'posts:following:{}'
+
+
+def _load(user_id):
+    ids = array('I', Follow.objects.filter(user_id=user_id).order_by(
+        'author_id').values_list('author_id', flat=True))
+    cache.set(KEY.format(user_id), ids.tobytes(),
+              settings.FOLLOW_GRAPH_TIMEOUT)
+    return ids
+
+
+def following_ids(user_id):
+    """Отсортированный массив id авторов, на которых подписан user_id."""
+    raw = cache.get(KEY.format(user_id))
+    if raw is None:
+        return _load(user_id)
+    ids = array('I')
+    ids.frombytes(raw)
+    return ids
+
+
+def _contains(ids, author_id):
+    index = bisect_left(ids, author_id)
+    return index < len(ids) and ids[index] == author_id
+
+
+def is_following(user_id, author_id):
+    if user_id is None:
+        return False
+    return _contains(following_ids(user_id), author_id)
+
+
+def following_flags(user_id, author_ids):
+    """Подмножество author_ids, на которых подписан user_id, за один вызов."""
+    if user_id is None:
+        return set()
+    ids = following_ids(user_id)
+    return {author_id for author_id in author_ids
+            if _contains(ids, author_id)}
+
+
+def following_count(user_id):
+    return len(following_ids(user_id))
+
+
+def _apply(added, removed):
+    changes = {}
+    for user_id, author_id in added:
+        changes.setdefault(user_id, (set(), set()))[0].add(author_id)
+    for user_id, author_id in removed:
+        changes.setdefault(user_id, (set(), set()))[1].add(author_id)
+    keys = {KEY.format(user_id): user_id for user_id in changes}
+    updated = {}
+    for key, raw in cache.get_many(keys).items():
+        add, remove = changes[keys[key]]
+        ids = array('I')
+        ids.frombytes(raw)
+        ids = array('I', sorted((set(ids) | add) - remove))
+        updated[key] = ids.tobytes()
+    # Чего нет в кэше, соберётся при чтении.
+    cache.set_many(updated, settings.FOLLOW_GRAPH_TIMEOUT)
+
+
+def update(added=(), removed=()):
+    """Вносит подписки и отписки (user_id, author_id) после коммита."""
+    added, removed = list(added), list(removed)
+    transaction.on_commit(lambda: _apply(added, removed))
@@ -0,0 +1,38 @@
+"""Хранилище ключей sorl-thumbnail с пакетным чтением.
+
+Поверх штатного cached_db: значения живут в кэше, а таблица
+thumbnail_kvstore остаётся надёжной копией. get_many_raw достаёт
+сразу все ключи страницы — один get_many из кэша и не больше одного
+запроса к базе за промахи. set_raw и delete_raw — открытые записи
+для своих ключей (см. thumbnails), чтобы не звать внутренние методы
+sorl.
+"""
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+
+class KVStore(cached_db_kvstore.KVStore):
+    def get_many_raw(self, keys):
+        """{ключ: значение} для найденных ключей."""
+        values = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            stored = dict(KVStoreModel.objects.filter(
+                key__in=missing).values_list('key', 'value'))
+            # Отсутствие тоже кэшируется, чтобы заглушки не ходили в базу.
+            found = {key: stored.get(key, EMPTY_VALUE) for key in missing}
+            self.cache.set_many(found, settings.THUMBNAIL_CACHE_TIMEOUT)
+            values.update(found)
+        return {key: value for key, value in values.items()
+                if value != EMPTY_VALUE}
+
+    def set_raw(self, key, value):
+        KVStoreModel.objects.update_or_create(
+            key=key, defaults={'value': value})
+        self.cache.set(key, value, settings.THUMBNAIL_CACHE_TIMEOUT)
+
+    def delete_raw(self, *keys):
+        KVStoreModel.objects.filter(key__in=keys).delete()
+        self.cache.delete_many(keys)
@@ -0,0 +1,153 @@
+"""Новые комментарии поста потоком Server-Sent Events.
+
+Открытый поток ждёт на своей очереди: сохранение комментария после
+коммита будит очереди этого процесса и записывает id последнего
+комментария поста в общий кэш. Потоки других процессов замечают новое
+значение, опрашивая кэш раз в LIVE_COMMENTS_POLL секунд, так что база
+читается только тогда, когда есть что отправить.
+
+Django 2.2 не умеет асинхронных представлений, поэтому поток — это
+генератор StreamingHttpResponse, который занимает рабочий поток
+сервера на LIVE_COMMENTS_TIMEOUT секунд; после этого браузер
+переподключается сам и продолжает с Last-Event-ID. Под обычным WSGI
+с пулом синхронных потоков это дороже перезагрузок страницы, поэтому
+поток выключен (LIVE_COMMENTS_STREAM), а страница раз в несколько
+секунд спрашивает latest — одно чтение кэша. Включённые потоки
+ограничены числом на процесс и на IP-адрес (open_stream).
+"""
+import json
+import queue
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.template.loader import render_to_string
+
+from .models import Comment
+
+LATEST_KEY = 'posts:live:{}'
+
+_lock = threading.Lock()
+_subscribers = {}
+# Открытые потоки этого процесса по IP-адресам.
+_streams = Counter()
+
+
+@contextmanager
+def subscribe(post_id):
+    """Очередь, в которую приходят id новых комментариев поста."""
+    inbox = queue.Queue()
+    with _lock:
+        _subscribers.setdefault(post_id, set()).add(inbox)
+    try:
+        yield inbox
+    finally:
+        with _lock:
+            inboxes = _subscribers[post_id]
+            inboxes.discard(inbox)
+            if not inboxes:
+                del _subscribers[post_id]
+
+
+def _publish(post_id, comment_id):
+    cache.set(LATEST_KEY.format(post_id), comment_id, timeout=None)
+    with _lock:
+        inboxes = list(_subscribers.get(post_id, ()))
+    for inbox in inboxes:
+        inbox.put(comment_id)
+
+
+def publish(comment):
+    """Оповещает открытые потоки о комментарии после фиксации транзакции."""
+    post_id, comment_id = comment.post_id, comment.pk
+    transaction.on_commit(lambda: _publish(post_id, comment_id))
+
+
+def latest(post_id):
+    """id последнего комментария поста: из кэша или одним запросом."""
+    key = LATEST_KEY.format(post_id)
+    comment_id = cache.get(key)
+    if comment_id is None:
+        comment_id = Comment.objects.filter(post_id=post_id).aggregate(
+            latest=Max('pk'))['latest'] or 0
+        cache.add(key, comment_id, settings.FEED_CACHE_TIMEOUT)
+    return comment_id
+
+
+def _event(comment):
+    html = render_to_string(
+        'posts/includes/comment.html', {'comment': comment})
+    data = json.dumps({'id': comment.pk, 'html': html}, ensure_ascii=False)
+    return f'id: {comment.pk}\nevent: comment\ndata: {data}\n\n'
+
+
+def stream(post_id, last_id):
+    """Генератор событий SSE с комментариями новее last_id."""
+    deadline = time.monotonic() + settings.LIVE_COMMENTS_TIMEOUT
+    with subscribe(post_id) as inbox:
+        yield f'retry: {settings.LIVE_COMMENTS_RETRY}\n\n'
+        sent = time.monotonic()
+        while True:
+            if latest(post_id) > last_id:
+                comments = Comment.objects.filter(
+                    post_id=post_id, pk__gt=last_id,
+                ).select_related('author').order_by('pk')
+                for comment in comments:
+                    yield _event(comment)
+                    last_id = comment.pk
+                sent = time.monotonic()
+            now = time.monotonic()
+            if now >= deadline:
+                return
+            if now - sent >= settings.LIVE_COMMENTS_PING:
+                # Комментарий SSE: не даёт прокси закрыть тихое
+                # соединение и выявляет ушедших клиентов.
+                yield ': ping\n\n'
+                sent = now
+            try:
+                inbox.get(timeout=min(
+                    settings.LIVE_COMMENTS_POLL, deadline - now))
+            except queue.Empty:
+                pass
+
+
+class Stream:
+    """Поток событий, занимающий место в лимитах до закрытия.
+
+    StreamingHttpResponse вызывает close() у содержимого, даже если
+    клиент ушёл до первого события и генератор так и не запускался.
+    """
+
+    def __init__(self, post_id, last_id, ip):
+        self.ip = ip
+        self.events = stream(post_id, last_id)
+        self.closed = False
+
+    def __iter__(self):
+        return self.events
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.events.close()
+        with _lock:
+            _streams[self.ip] -= 1
+            if not _streams[self.ip]:
+                del _streams[self.ip]
+
+
+def open_stream(post_id, last_id, ip):
+    """Stream или None, если потоков процесса или адреса уже слишком
+    много."""
+    with _lock:
+        if (sum(_streams.values()) >= settings.LIVE_COMMENTS_MAX_STREAMS
+                or _streams[ip] >= settings.LIVE_COMMENTS_MAX_STREAMS_PER_IP):
+            return None
+        _streams[ip] += 1
+    return Stream(post_id, last_id, ip)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts import suggestions
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рекомендации «на кого подписаться»'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Сколько авторов и читателей считать за один проход')
+
+    def handle(self, *args, **options):
+        users = suggestions.rebuild(options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Рекомендации пересчитаны для {users} читателей'))
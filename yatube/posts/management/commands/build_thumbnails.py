@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Строит миниатюры картинок постов, для которых их ещё нет, '
+            'и заполняет размеры, цвет и превью картинок')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='перестроить и уже готовые миниатюры')
+
+    def handle(self, *args, **options):
+        names = (Post.objects.exclude(image='')
+                 .values_list('image', flat=True).distinct().iterator())
+        built = 0
+        for name in names:
+            if not options['force'] and thumbnails.urls_for([name]):
+                continue
+            try:
+                thumbnails.generate(name)
+            except FileNotFoundError:
+                self.stderr.write(f'Нет файла {name}')
+                continue
+            built += 1
+        self.stdout.write(self.style.SUCCESS(f'Построено миниатюр: {built}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Описано картинок: {self.describe_missing()}'))
+
+    def describe_missing(self):
+        storage = Post._meta.get_field('image').storage
+        names = (Post.objects.exclude(image='')
+                 .filter(image_width__isnull=True)
+                 .values_list('image', flat=True).distinct().iterator())
+        described = 0
+        for name in names:
+            try:
+                with storage.open(name) as file:
+                    metadata = thumbnails.describe(file)
+            except OSError:
+                self.stderr.write(f'Не удалось прочитать {name}')
+                continue
+            # save() с сигналами, чтобы сбросить кэши карточек и страниц.
+            for post in Post.objects.filter(image=name).select_related(
+                    'author', 'group'):
+                post.__dict__.update(metadata)
+                post.save(update_fields=list(metadata))
+            described += 1
+        return described
@@ -0,0 +1,107 @@
+import os
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from posts import thumbnails
+from posts.models import Post
+
+
+def walk(root, directory):
+    """Файлы каталога вглубь, без списка всего дерева в памяти."""
+    stack = [os.path.join(root, directory)]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = ('Находит и удаляет картинки, на которые не ссылается ни один '
+            'пост, и миниатюры, которых нет в хранилище ключей sorl')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько файлов сверять с базой за один запрос')
+        parser.add_argument(
+            '--min-age', type=int, default=60 * 60,
+            help='Не трогать файлы моложе стольких секунд: загрузка или '
+                 'миниатюра может быть ещё не записана в базу')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что было бы удалено')
+
+    def handle(self, *args, **options):
+        self.root = settings.MEDIA_ROOT
+        self.verbosity = options['verbosity']
+        self.dry_run = options['dry_run']
+        self.newer_than = time.time() - options['min_age']
+        self.batch_size = options['batch_size']
+        upload_to = Post._meta.get_field('image').upload_to
+        originals = self.collect(upload_to, self.orphaned_originals)
+        cached = self.collect(
+            thumbnail_settings.THUMBNAIL_PREFIX, self.stale_thumbnails)
+        verb = 'Будет удалено' if self.dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb}: картинок {originals[0]}, миниатюр {cached[0]}, '
+            f'{(originals[1] + cached[1]) // 1024} КБ'))
+
+    def collect(self, directory, find_orphans):
+        count = size = 0
+        files = (entry for entry in walk(self.root, directory)
+                 if entry.stat().st_mtime < self.newer_than)
+        for batch in batches(files, self.batch_size):
+            named = {os.path.relpath(entry.path, self.root).replace(
+                os.sep, '/'): entry for entry in batch}
+            for name in find_orphans(named):
+                entry = named[name]
+                size += entry.stat().st_size
+                count += 1
+                if self.verbosity > 1 or self.dry_run:
+                    self.stdout.write(name)
+                if not self.dry_run:
+                    self.delete(name, directory)
+        return count, size
+
+    def delete(self, name, directory):
+        if directory == thumbnail_settings.THUMBNAIL_PREFIX:
+            default.storage.delete(name)
+        else:
+            # release перепроверит ссылки под блокировкой загрузок.
+            thumbnails.release(name)
+
+    def orphaned_originals(self, named):
+        used = set(Post.objects.filter(image__in=list(named)).values_list(
+            'image', flat=True))
+        return [name for name in named if name not in used]
+
+    def stale_thumbnails(self, named):
+        keys = {add_prefix(ImageFile(name, default.storage).key): name
+                for name in named}
+        known = set(KVStore.objects.filter(key__in=list(keys)).values_list(
+            'key', flat=True))
+        return [name for key, name in keys.items() if key not in known]
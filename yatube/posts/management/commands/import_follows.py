@@ -0,0 +1,44 @@
+import csv
+import sys
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from posts import follows
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = ('Импортирует подписки из CSV со строками «подписчик,автор» '
+            '(имена пользователей); «-» — читать из stdin')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько подписок записывать за один проход')
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            self.import_rows(csv.reader(sys.stdin), options['batch_size'])
+            return
+        with open(options['path'], newline='', encoding='utf-8') as file:
+            self.import_rows(csv.reader(file), options['batch_size'])
+
+    def import_rows(self, rows, batch_size):
+        created = skipped = 0
+        rows = (row for row in rows if len(row) == 2)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            names = {name for row in batch for name in row}
+            ids = dict(User.objects.filter(username__in=names).values_list(
+                'username', 'pk'))
+            edges = [(ids[user], ids[author]) for user, author in batch
+                     if user in ids and author in ids]
+            created += follows.follow_many(edges)
+            skipped += len(batch) - len(edges)
+        self.stdout.write(self.style.SUCCESS(
+            f'Новых подписок: {created}, строк с неизвестными '
+            f'пользователями: {skipped}'))
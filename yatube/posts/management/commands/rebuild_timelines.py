@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='id пользователя (можно указать несколько раз)')
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Сколько лент пересобирать в одной транзакции')
+
+    def handle(self, *args, **options):
+        timeline.rebuild(options['user_ids'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Ленты пересобраны'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = 'Сверяет денормализованные счётчики с фактическими данными'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько объектов пересчитывать за один проход')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model, recount in counters.RECOUNTERS:
+            fixed = 0
+            last_pk = 0
+            while True:
+                ids = list(
+                    model.objects.filter(pk__gt=last_pk).order_by(
+                        'pk').values_list('pk', flat=True)[:batch_size]
+                )
+                if not ids:
+                    break
+                fixed += recount(ids)
+                last_pk = ids[-1]
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: исправлено {fixed}')
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0008_image_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Suggestion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('user', 'Читателю'), ('author', 'Похожие на автора')], max_length=6, verbose_name='Вид')),
+                ('score', models.FloatField(verbose_name='Вес')),
+                ('computed', models.DateTimeField(verbose_name='Посчитано')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Для кого')),
+            ],
+            options={
+                'verbose_name_plural': 'Рекомендации авторов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='suggestion',
+            index=models.Index(fields=['kind', 'subject', '-score'], name='suggestion_subject_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='suggestion',
+            index=models.Index(fields=['computed'], name='suggestion_computed_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_suggestion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='Имя файла')),
+            ],
+            options={
+                'verbose_name_plural': 'Картинки в хранилище',
+            },
+        ),
+    ]
@@ -1,10 +1,32 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from .storage import content_storage
+
 User = get_user_model()
 
 
-class Post(models.Model):
+class CounterFieldsMixin:
+    """Обычный save() не перезаписывает денормализованные счётчики.
+
+    Счётчики меняются только атомарными UPDATE ... SET n = n + 1, и
+    сохранение устаревшего экземпляра (например, из формы) не должно
+    откатывать их к значению на момент чтения.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class Post(CounterFieldsMixin, models.Model):
     text = models.TextField(verbose_name='Текст',
                             help_text='Текст нового поста')
     pub_date = models.DateTimeField(verbose_name='Дата',
@@ -28,18 +50,42 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=content_storage,
         blank=True
     )
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки', null=True, editable=False)
+    image_height = models.PositiveIntegerField(
+        'Высота картинки', null=True, editable=False)
+    image_color = models.CharField(
+        'Основной цвет картинки', max_length=7, blank=True, editable=False)
+    image_placeholder = models.TextField(
+        'Размытая превью картинки', blank=True, editable=False)
+    comments_count = models.PositiveIntegerField(
+        verbose_name='Комментариев',
+        default=0,
+        editable=False)
+
+    counter_fields = ('comments_count',)
 
     class Meta:
         verbose_name_plural = 'Публикации'
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_date_idx'),
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_date_id_idx'),
+            models.Index(fields=['image'], name='post_image_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
 
-class Group(models.Model):
+class Group(CounterFieldsMixin, models.Model):
     title = models.CharField(verbose_name='Заголовок',
                              max_length=200,
                              help_text='Заголовок нового поста')
@@ -48,6 +94,12 @@ class Group(models.Model):
                             help_text='Выберите псевдоним')
     description = models.TextField(verbose_name='Описание группы',
                                    help_text='Напишите описание')
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Постов',
+        default=0,
+        editable=False)
+
+    counter_fields = ('posts_count',)
 
     class Meta:
         verbose_name_plural = 'Группы'
@@ -75,6 +127,13 @@ class Comment(models.Model):
                                    auto_now_add=True,
                                    help_text='Заполните дату')
 
+    class Meta:
+        ordering = ['created']
+        indexes = [
+            models.Index(fields=['post', 'created'],
+                         name='comment_post_created_idx'),
+        ]
+
     def __str__(self):
         return self.text
 
@@ -98,3 +157,106 @@ class Follow(models.Model):
                 name='unique follow'
             )
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель')
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор')
+    pub_date = models.DateTimeField(verbose_name='Дата')
+
+    class Meta:
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique timeline entry'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='timeline_user_date_post_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='timeline_user_author_idx'),
+        ]
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь')
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Подписчиков', default=0)
+    following_count = models.PositiveIntegerField(
+        verbose_name='Подписок', default=0)
+
+    class Meta:
+        verbose_name_plural = 'Счётчики пользователей'
+
+
+class StoredImage(models.Model):
+    """Картинка в хранилище; строка служит блокировкой её файла."""
+    name = models.CharField(verbose_name='Имя файла',
+                            max_length=255,
+                            primary_key=True)
+
+    class Meta:
+        verbose_name_plural = 'Картинки в хранилище'
+
+    def __str__(self):
+        return self.name
+
+
+class Suggestion(models.Model):
+    USER = 'user'
+    AUTHOR = 'author'
+    KINDS = (
+        (USER, 'Читателю'),
+        (AUTHOR, 'Похожие на автора'),
+    )
+
+    kind = models.CharField(verbose_name='Вид',
+                            max_length=6,
+                            choices=KINDS)
+    subject = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Для кого')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор')
+    score = models.FloatField(verbose_name='Вес')
+    computed = models.DateTimeField(verbose_name='Посчитано')
+
+    class Meta:
+        verbose_name_plural = 'Рекомендации авторов'
+        indexes = [
+            models.Index(fields=['kind', 'subject', '-score'],
+                         name='suggestion_subject_score_idx'),
+            models.Index(fields=['computed'],
+                         name='suggestion_computed_idx'),
+        ]
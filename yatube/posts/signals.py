@@ -0,0 +1,153 @@
+from django.db.models.signals import (
+    post_delete, post_init, post_save, pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import (
+    caching, counters, freshness, graph, live, thumbnails, timeline)
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_init, sender=Post)
+def post_loaded(sender, instance, **kwargs):
+    # Без обращения к атрибуту: у отложенного поля это был бы запрос.
+    instance._loaded_group_id = instance.__dict__.get('group_id')
+    image = instance.__dict__.get('image')
+    instance._loaded_image = getattr(image, 'name', image)
+
+
+@receiver(pre_save, sender=Post)
+def post_image_described(sender, instance, raw=False, **kwargs):
+    # Новая загрузка ещё в памяти или во временном файле: размеры и
+    # превью снимаются с неё, а не при показе.
+    if raw or 'image' not in instance.__dict__:
+        return
+    image = instance.image
+    if not image:
+        instance.image_width = instance.image_height = None
+        instance.image_color = instance.image_placeholder = ''
+    elif not image._committed:
+        try:
+            metadata = thumbnails.describe(image.file)
+        except OSError:
+            return
+        for field, value in metadata.items():
+            setattr(instance, field, value)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        timeline.fan_out(instance)
+        counters.shift_user(instance.author_id, posts_count=1)
+        counters.shift_group(instance.group_id, 1)
+    elif instance.group_id != instance._loaded_group_id:
+        counters.shift_group(instance._loaded_group_id, -1)
+        counters.shift_group(instance.group_id, 1)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_touched(sender, instance, **kwargs):
+    group_ids = {instance.group_id, instance._loaded_group_id} - {None}
+    freshness.touch(f'post:{instance.pk}', f'author:{instance.author_id}',
+                    *(f'group:{group_id}' for group_id in group_ids))
+    instance._loaded_group_id = instance.group_id
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_touched(sender, instance, **kwargs):
+    freshness.touch(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_touched(sender, instance, **kwargs):
+    freshness.touch(f'author:{instance.author_id}',
+                    f'author:{instance.user_id}')
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_touched(sender, instance, **kwargs):
+    # Страницы постов группы зависят от её отметки (см. freshness),
+    # а профили авторов показывают её адрес в карточках.
+    freshness.touch(f'group:{instance.pk}', *(
+        f'author:{author_id}' for author_id in instance.posts.values_list(
+            'author_id', flat=True).distinct()))
+
+
+@receiver(post_save, sender=User)
+def user_touched(sender, instance, **kwargs):
+    freshness.touch(f'author:{instance.pk}')
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.shift_user(instance.author_id, posts_count=-1)
+    counters.shift_group(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_image_changed(sender, instance, signal, created=False, raw=False,
+                       **kwargs):
+    # Картинка могла остаться без ссылок (см. thumbnails.release).
+    if 'image' not in instance.__dict__:
+        return
+    if signal is post_delete:
+        released = instance.image.name
+    else:
+        released = instance._loaded_image
+        instance._loaded_image = instance.image.name
+        if raw or created or released == instance.image.name:
+            return
+    thumbnails.schedule_release(released)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.shift_post(instance.post_id, 1)
+        live.publish(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.shift_post(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.backfill(instance.user_id, instance.author_id)
+        graph.update(added=[(instance.user_id, instance.author_id)])
+        counters.shift_user(instance.user_id, following_count=1)
+        counters.shift_user(instance.author_id, followers_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    timeline.prune(instance.user_id, instance.author_id)
+    graph.update(removed=[(instance.user_id, instance.author_id)])
+    counters.shift_user(instance.user_id, following_count=-1)
+    counters.shift_user(instance.author_id, followers_count=-1)
+
+
+def content_changed(sender, **kwargs):
+    caching.bump_generation()
+
+
+for model in (Post, Comment, Group, Follow):
+    post_save.connect(content_changed, sender=model,
+                      dispatch_uid=f'generation_save_{model.__name__}')
+    post_delete.connect(content_changed, sender=model,
+                        dispatch_uid=f'generation_delete_{model.__name__}')
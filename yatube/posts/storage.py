@@ -0,0 +1,62 @@
+"""Хранилище картинок, адресуемое содержимым.
+
+Файл называется SHA-256 своего содержимого и лежит в подкаталогах по
+первым символам хэша: posts/ab/cd/abcd….jpg. Одинаковые загрузки
+получают одно имя, поэтому оригинал и миниатюры (sorl строит их имена
+из имени исходника) хранятся один раз. Удаляет общий файл
+thumbnails.release, когда на него не ссылается ни один пост.
+
+Загрузка и освобождение одного файла берут блокировку строки
+StoredImage (lock): если загрузка нашла файл на диске, release дождётся
+её транзакции и увидит новый пост, а если release успел первым,
+загрузка увидит, что файла уже нет, и запишет его заново.
+"""
+import hashlib
+import os
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+
+def lock(name):
+    """Блокирует файл name до конца текущей транзакции."""
+    # Модели импортируют это хранилище, поэтому модель берётся из реестра.
+    StoredImage = apps.get_model('posts', 'StoredImage')
+    StoredImage.objects.get_or_create(name=name)
+    # UPDATE держит блокировку строки (в SQLite — базы на запись) до
+    # коммита, в отличие от select_for_update, который SQLite пропускает.
+    StoredImage.objects.filter(name=name).update(name=F('name'))
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(
+            directory, digest[:2], digest[2:4], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        with transaction.atomic():
+            lock(name)
+            if self.exists(name):
+                return name
+            saved = super().save(name, content, max_length)
+        if saved != name:
+            # Тот же файл одновременно записала параллельная загрузка.
+            self.delete(saved)
+        return name
+
+
+content_storage = ContentAddressedStorage()
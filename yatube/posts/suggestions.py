@@ -0,0 +1,181 @@
+"""Рекомендации «на кого подписаться» по совместным подпискам.
+
+Похожесть авторов X и Y — косинус их столбцов в матрице подписок: число
+общих подписчиков, делённое на корень из произведения чисел
+подписчиков. Читателю предлагаются авторы с наибольшей суммой
+похожести на тех, на кого он уже подписан.
+
+Команда build_suggestions считает всё в два прохода, и в памяти
+никогда не лежит вся таблица Follow. Сначала идут пачки по chunk_size
+авторов: подписчики пачки и их подписки читаются из базы, а для
+каждого автора сохраняются SUGGESTIONS_NEIGHBOURS самых похожих.
+Затем идут пачки читателей: их подписки и сохранённые соседи этих
+авторов дают рекомендации читателю. Страницы читают готовые строки
+Suggestion одним запросом по индексу.
+"""
+import heapq
+import math
+from array import array
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from . import freshness, graph
+from .caching import bump_generation
+from .models import Follow, Suggestion
+
+
+def _chunks(ids, size):
+    iterator = iter(ids)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def _distinct(field, chunk_size):
+    """Различные значения столбца Follow пачками, по индексу."""
+    last = 0
+    while True:
+        ids = list(Follow.objects.filter(**{f'{field}__gt': last}).order_by(
+            field).values_list(field, flat=True).distinct()[:chunk_size])
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def _following(user_ids):
+    """{читатель: массив id авторов} для пачки читателей."""
+    following = {}
+    rows = Follow.objects.filter(user_id__in=user_ids).values_list(
+        'user_id', 'author_id')
+    for user_id, author_id in rows.iterator():
+        following.setdefault(user_id, array('I')).append(author_id)
+    return following
+
+
+def _follower_counts(author_ids, chunk_size):
+    counts = {}
+    for batch in _chunks(author_ids, chunk_size):
+        counts.update(Follow.objects.filter(author_id__in=batch).values(
+            'author_id').annotate(count=Count('pk')).values_list(
+            'author_id', 'count'))
+    return counts
+
+
+def similar_authors(author_ids, chunk_size, limit):
+    """{автор: [(похожесть, другой автор), ...]} для пачки авторов."""
+    chunk = set(author_ids)
+    readers = sorted(set(Follow.objects.filter(
+        author_id__in=author_ids).values_list('user_id', flat=True)))
+    common = {author_id: Counter() for author_id in author_ids}
+    for batch in _chunks(readers, chunk_size):
+        for followed in _following(batch).values():
+            for author_id in chunk.intersection(followed):
+                common[author_id].update(followed)
+    others = set(chunk).union(*common.values())
+    counts = _follower_counts(sorted(others), chunk_size)
+    result = {}
+    for author_id, counter in common.items():
+        del counter[author_id]
+        result[author_id] = heapq.nlargest(limit, (
+            (count / math.sqrt(counts[author_id] * counts[other]), other)
+            for other, count in counter.items()))
+    return result
+
+
+def _neighbours(author_ids, chunk_size):
+    """Сохранённые первым проходом похожие авторы."""
+    neighbours = {}
+    for batch in _chunks(sorted(author_ids), chunk_size):
+        rows = Suggestion.objects.filter(
+            kind=Suggestion.AUTHOR, subject_id__in=batch,
+        ).values_list('subject_id', 'score', 'author_id')
+        for subject_id, score, author_id in rows.iterator():
+            neighbours.setdefault(subject_id, []).append((score, author_id))
+    return neighbours
+
+
+def suggest(user_id, author_ids, neighbours, limit):
+    """Лучшие [(вес, автор), ...] для читателя с подписками author_ids."""
+    scores = Counter()
+    for author_id in author_ids:
+        for score, other in neighbours.get(author_id, ()):
+            scores[other] += score
+    exclude = {user_id, *author_ids}
+    return heapq.nlargest(limit, (
+        (score, other) for other, score in scores.items()
+        if other not in exclude))
+
+
+def _store(kind, ranked, computed):
+    """Заменяет рекомендации пачки одной транзакцией."""
+    with transaction.atomic():
+        Suggestion.objects.filter(
+            kind=kind, subject_id__in=list(ranked)).delete()
+        Suggestion.objects.bulk_create([
+            Suggestion(kind=kind, subject_id=subject_id,
+                       author_id=author_id, score=score, computed=computed)
+            for subject_id, pairs in ranked.items()
+            for score, author_id in pairs
+        ])
+
+
+def rebuild(chunk_size=1000):
+    """Пересчитывает все рекомендации; возвращает число читателей."""
+    started = timezone.now()
+    for chunk in _distinct('author_id', chunk_size):
+        # Соседей хранится больше, чем показывается: второй проход
+        # складывает их по всем подпискам читателя.
+        _store(Suggestion.AUTHOR,
+               similar_authors(
+                   chunk, chunk_size, settings.SUGGESTIONS_NEIGHBOURS),
+               started)
+        # Профили отвечают 304 по отметке автора, а блок похожих
+        # авторов на них поменялся.
+        freshness.touch(*(f'author:{author_id}' for author_id in chunk))
+    users = 0
+    for chunk in _distinct('user_id', chunk_size):
+        following = _following(chunk)
+        neighbours = _neighbours(
+            set().union(*following.values()), chunk_size)
+        _store(Suggestion.USER,
+               {user_id: suggest(user_id, author_ids, neighbours,
+                                 settings.SUGGESTIONS_COUNT)
+                for user_id, author_ids in following.items()},
+               started)
+        users += len(chunk)
+    # Кто с прошлого раза остался без подписок или подписчиков.
+    Suggestion.objects.filter(computed__lt=started).delete()
+    bump_generation()
+    return users
+
+
+def _authors(kind, subject_id):
+    return [suggestion.author for suggestion in Suggestion.objects.filter(
+        kind=kind, subject_id=subject_id,
+    ).select_related('author').order_by('-score')[
+        :settings.SUGGESTIONS_COUNT]]
+
+
+def for_user(user):
+    """Авторы, которых стоит предложить читателю."""
+    if not user.is_authenticated:
+        return []
+    authors = _authors(Suggestion.USER, user.pk)
+    if not authors:
+        return []
+    # Подписки, оформленные после пересчёта, отсекает граф в кэше.
+    followed = graph.following_flags(
+        user.pk, [author.pk for author in authors])
+    return [author for author in authors if author.pk not in followed]
+
+
+def similar_to(author):
+    """Авторы, на которых подписаны читатели author."""
+    return _authors(Suggestion.AUTHOR, author.pk)
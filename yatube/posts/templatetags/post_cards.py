@@ -0,0 +1,55 @@
+import hashlib
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from posts import thumbnails
+from posts.utils import encode_cursor
+
+register = template.Library()
+
+CARD_TEMPLATE = 'posts/includes/post_card.html'
+
+
+def card_key(post, thumbs=None):
+    """Ключ карточки: id поста и версия всего, что в неё попадает."""
+    author = post.author
+    version = hashlib.md5('|'.join((
+        post.text,
+        post.image.name or '',
+        post.image_color,
+        thumbs['card']['srcset'] + thumbs['card']['webp'] if thumbs else '',
+        post.group.slug if post.group_id else '',
+        author.username,
+        author.get_full_name(),
+        post.pub_date.isoformat(),
+    )).encode()).hexdigest()
+    return f'post_card:{post.pk}:{version}'
+
+
+@register.filter
+def post_cards(posts):
+    """Карточки постов страницы: один get_many и рендер только промахов."""
+    posts = list(posts)
+    ready = thumbnails.urls_for(post.image.name for post in posts)
+    thumbs = [ready.get(post.image.name) for post in posts]
+    keys = [card_key(post, urls) for post, urls in zip(posts, thumbs)]
+    cards = cache.get_many(keys)
+    missing = {}
+    for key, post, urls in zip(keys, posts, thumbs):
+        if key not in cards:
+            missing[key] = render_to_string(
+                CARD_TEMPLATE, {'post': post, 'thumbs': urls})
+    if missing:
+        cache.set_many(missing, settings.POST_CARD_CACHE_TIMEOUT)
+        cards.update(missing)
+    return [mark_safe(cards[key]) for key in keys]
+
+
+@register.filter
+def cursor(post):
+    """Курсор (pub_date, id) поста, например для опроса новых постов."""
+    return encode_cursor(post)
@@ -0,0 +1,244 @@
+import base64
+import json
+import os
+import tempfile
+from http import HTTPStatus
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, TimelineEntry, UserStats
+from ..utils import encode_cursor
+
+User = get_user_model()
+
+
+class PostApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='follower')
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            description='Тестовый текст',
+            slug='test-slug',
+        )
+        cls.posts = [
+            Post.objects.create(
+                text=f'Тестовый пост {i}',
+                author=cls.author,
+                group=cls.group)
+            for i in range(13)
+        ]
+        cls.post = cls.posts[-1]
+        Comment.objects.create(
+            text='Комментарий', post=cls.post, author=cls.user)
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_feeds(self):
+        """Ленты отдают посты страницами по курсору."""
+        urls = (
+            reverse('posts:api_index'),
+            reverse('posts:api_group', args=(self.group.slug,)),
+            reverse('posts:api_profile', args=(self.author.username,)),
+            reverse('posts:api_follow'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                data = self.authorized_client.get(url).json()
+                self.assertEqual(len(data['results']), 10)
+                self.assertEqual(data['results'][0]['id'], self.post.pk)
+                self.assertEqual(data['results'][0]['group'], 'test-slug')
+                data = self.authorized_client.get(
+                    url, {'after': data['next']}).json()
+                self.assertEqual(len(data['results']), 3)
+                self.assertIsNone(data['next'])
+
+    def test_sparse_fields(self):
+        """?fields= оставляет в ответе только перечисленные поля."""
+        data = self.client.get(
+            reverse('posts:api_index'), {'fields': 'id,text'}).json()
+        self.assertEqual(set(data['results'][0]), {'id', 'text'})
+        response = self.client.get(
+            reverse('posts:api_index'), {'fields': 'id,password'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_post_with_comments(self):
+        """Пост отдаётся вместе со страницей комментариев."""
+        data = self.client.get(
+            reverse('posts:api_post_detail', args=(self.post.pk,)),
+            {'comment_fields': 'text'}).json()
+        self.assertEqual(data['text'], self.post.text)
+        self.assertEqual(data['comments_count'], 1)
+        self.assertEqual(data['comments']['results'],
+                         [{'text': 'Комментарий'}])
+
+    def test_etag(self):
+        """Неизменившийся ответ отдаётся как 304."""
+        url = reverse('posts:api_index')
+        response = self.client.get(url)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_follow_requires_auth(self):
+        """Лента подписок без авторизации отвечает 401."""
+        response = self.client.get(reverse('posts:api_follow'))
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+
+class NewPostsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cls.post = Post.objects.create(
+            text='Первый пост', author=cls.author, group=cls.group)
+        cls.urls = (
+            reverse('posts:api_index_new'),
+            reverse('posts:api_group_new', args=(cls.group.slug,)),
+            reverse('posts:api_follow_new'),
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.since = {'since': encode_cursor(self.post)}
+
+    def test_not_modified_without_new_posts(self):
+        """Без новых постов — 304, а повторный опрос не ходит в базу."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url, self.since)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.NOT_MODIFIED)
+        self.client.get(self.urls[0], self.since)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.urls[0], self.since)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_revalidation_skips_session(self):
+        """Опрос по ETag из вкладки с входом не читает сессию."""
+        for url in self.urls[:2]:
+            with self.subTest(url=url):
+                etag = self.authorized_client.get(url, self.since)['ETag']
+                with self.assertNumQueries(0):
+                    response = self.authorized_client.get(
+                        url, self.since, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.NOT_MODIFIED)
+
+    def test_count_of_new_posts(self):
+        """Новые посты считаются в каждой ленте."""
+        for number in range(2):
+            Post.objects.create(
+                text=f'Новый пост {number}', author=self.author,
+                group=self.group)
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url, self.since)
+                self.assertEqual(response.json()['count'], 2)
+
+    def test_bad_cursor_and_auth(self):
+        """Битый курсор — 400, лента подписок без входа — 401."""
+        response = self.client.get(self.urls[0], {'since': 'плохой'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        naive = base64.urlsafe_b64encode(b'2020-01-01T00:00:00|1').decode()
+        for url in self.urls[:2]:
+            with self.subTest(url=url):
+                response = self.client.get(url, {'since': naive})
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.BAD_REQUEST)
+        response = self.client.get(self.urls[2], self.since)
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+    def test_feed_page_polls_endpoint(self):
+        """Первая страница ленты знает адрес опроса и свой курсор."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(
+            response,
+            f'{self.urls[0]}?since={self.since["since"]}')
+
+
+class BulkFollowTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.authors = [
+            User.objects.create_user(username=f'author{i}') for i in range(3)]
+        for author in cls.authors:
+            Post.objects.create(text=f'Пост {author.username}', author=author)
+        cls.url = reverse('posts:api_follow_bulk')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def post(self, payload, client=None):
+        return (client or self.authorized_client).post(
+            self.url, json.dumps(payload), content_type='application/json')
+
+    def test_follow_and_unfollow_many(self):
+        """Пакетная подписка обновляет подписки, ленту и счётчики."""
+        names = [author.username for author in self.authors]
+        data = self.post({'follow': names + ['nobody', 'reader']}).json()
+        self.assertEqual(data, {'followed': 3, 'unfollowed': 0,
+                                'unknown': ['nobody']})
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(
+            UserStats.objects.get(user=self.user).following_count, 3)
+        self.assertEqual(self.post({'follow': names}).json()['followed'], 0)
+
+        data = self.post({'unfollow': names[:2]}).json()
+        self.assertEqual(data['unfollowed'], 2)
+        self.assertEqual(Follow.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.authors[0]).followers_count, 0)
+
+    def test_bad_requests(self):
+        """Без авторизации 401, на кривые данные 400."""
+        response = self.post({'follow': ['author0']}, client=Client())
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+        for payload in ([], {'follow': 'author0'}, {'follow': [1]}):
+            with self.subTest(payload=payload):
+                response = self.post(payload)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.BAD_REQUEST)
+
+    def test_import_follows_command(self):
+        """import_follows читает CSV пачками и пропускает неизвестных."""
+        rows = '\n'.join(
+            f'reader,{author.username}' for author in self.authors)
+        path = self.tmp_csv(rows + '\nreader,nobody\n')
+        out = StringIO()
+        call_command('import_follows', path, '--batch-size', '2', stdout=out)
+        self.assertIn('Новых подписок: 3', out.getvalue())
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.user).count(), 3)
+
+    def tmp_csv(self, content):
+        file = tempfile.NamedTemporaryFile(
+            'w', suffix='.csv', delete=False, encoding='utf-8')
+        with file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        return file.name
@@ -24,7 +24,7 @@ class PostCreateFormTests(TestCase):
             id=1,
         )
 
-        small_gif = (
+        cls.small_gif = small_gif = (
             b'\x47\x49\x46\x38\x39\x61\x02\x00'
             b'\x01\x00\x80\x00\x00\x00\x00\x00'
             b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
@@ -111,3 +111,32 @@ class PostCreateFormTests(TestCase):
         self.assertEqual(Comment.objects.count(), comments_count + 1)
         self.assertRedirects(response, reverse(
             'posts:post_detail', args=(self.post.id,)))
+
+    def assert_upload_rejected(self, name, content):
+        posts_count = Post.objects.count()
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            {'text': 'Пост с плохой картинкой',
+             'image': SimpleUploadedFile(name, content)})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertTrue(response.context['form'].has_error('image'))
+        self.assertEqual(Post.objects.count(), posts_count)
+
+    @override_settings(MAX_IMAGE_UPLOAD_SIZE=16)
+    def test_upload_too_large(self):
+        """Файл больше лимита отбрасывается при загрузке."""
+        self.assert_upload_rejected('small.gif', self.small_gif)
+
+    @override_settings(MAX_IMAGE_PIXELS=1)
+    def test_upload_too_many_pixels(self):
+        """Размеры из заголовка проверяются до сохранения."""
+        self.assert_upload_rejected('small.gif', self.small_gif)
+
+    @override_settings(IMAGE_UPLOAD_FORMATS=('PNG',))
+    def test_upload_wrong_format(self):
+        """Неразрешённый формат отклоняется."""
+        self.assert_upload_rejected('small.gif', self.small_gif)
+
+    def test_upload_not_image(self):
+        """Файл без заголовка картинки отклоняется."""
+        self.assert_upload_rejected('fake.gif', b'x' * 300 * 1024)
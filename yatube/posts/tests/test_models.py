@@ -1,10 +1,31 @@
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 
-from ..models import Group, Post, Comment, Follow
+from .. import thumbnails
+from ..models import Group, Post, Comment, Follow, StoredImage, UserStats
 
 User = get_user_model()
 
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
 
 class PostModelTest(TestCase):
     @classmethod
@@ -113,3 +134,144 @@ class PostModelTest(TestCase):
             with self.subTest(field=field):
                 self.assertEqual(
                     comment._meta.get_field(field).help_text, expected_value)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='follower')
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+
+    def assert_counts(self, posts, followers, group_posts):
+        stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(stats.posts_count, posts)
+        self.assertEqual(stats.followers_count, followers)
+        self.assertEqual(
+            UserStats.objects.get(user=self.user).following_count, followers)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, group_posts)
+
+    def test_counters_follow_writes_and_deletes(self):
+        """Счётчики меняются при создании и удалении объектов."""
+        post = Post.objects.create(
+            author=self.author, text='Текст', group=self.group)
+        Comment.objects.create(author=self.user, text='Текст', post=post)
+        Follow.objects.create(user=self.user, author=self.author)
+        self.assert_counts(posts=1, followers=1, group_posts=1)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        post.group = None
+        post.save()
+        self.assert_counts(posts=1, followers=1, group_posts=0)
+        Follow.objects.all().delete()
+        post.delete()
+        self.assert_counts(posts=0, followers=0, group_posts=0)
+
+    def test_save_keeps_counters(self):
+        """Сохранение устаревшего экземпляра не затирает счётчик."""
+        post = Post.objects.create(author=self.author, text='Текст')
+        Comment.objects.create(author=self.user, text='Текст', post=post)
+        post.text = 'Новый текст'
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+
+    def test_reconcile_counters(self):
+        """reconcile_counters исправляет расхождения."""
+        Post.objects.bulk_create([
+            Post(author=self.author, text='Текст', group=self.group)
+            for _ in range(3)
+        ])
+        call_command('reconcile_counters', batch_size=1, stdout=StringIO())
+        self.assert_counts(posts=3, followers=0, group_posts=3)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentStorageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, filename):
+        return Post.objects.create(
+            text='Репост', author=self.user,
+            image=SimpleUploadedFile(filename, SMALL_GIF, 'image/gif'))
+
+    def test_same_content_shares_file(self):
+        """Одинаковые загрузки получают одно имя в шардированном каталоге."""
+        first = self.create_post('cat.gif')
+        second = self.create_post('meme.GIF')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name,
+                         r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.gif$')
+        directory = os.path.dirname(first.image.path)
+        self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_release_waits_for_last_reference(self):
+        """Общий файл удаляется только вместе с последним постом."""
+        first = self.create_post('cat.gif')
+        second = self.create_post('meme.gif')
+        path = first.image.path
+        first.delete()
+        self.assertFalse(thumbnails.release(first.image.name))
+        self.assertTrue(os.path.exists(path))
+        second.delete()
+        self.assertTrue(thumbnails.release(second.image.name))
+        self.assertFalse(os.path.exists(path))
+
+    def test_upload_after_release_rewrites_file(self):
+        """Загрузка после освобождения того же файла записывает его снова."""
+        first = self.create_post('cat.gif')
+        name = first.image.name
+        self.assertTrue(StoredImage.objects.filter(name=name).exists())
+        first.delete()
+        self.assertTrue(thumbnails.release(name))
+        self.assertFalse(StoredImage.objects.filter(name=name).exists())
+        second = self.create_post('cat.gif')
+        self.assertEqual(second.image.name, name)
+        self.assertTrue(os.path.exists(second.image.path))
+
+    def test_clean_media(self):
+        """clean_media удаляет только старые файлы без ссылок."""
+        post = self.create_post('cat.gif')
+        urls = thumbnails.generate(post.image.name)
+        orphan = os.path.join(TEMP_MEDIA_ROOT, 'posts', 'old.gif')
+        stale = os.path.join(TEMP_MEDIA_ROOT, 'cache', 'aa', 'stale.jpg')
+        fresh = os.path.join(TEMP_MEDIA_ROOT, 'posts', 'uploading.gif')
+        os.makedirs(os.path.dirname(stale), exist_ok=True)
+        for path in (orphan, stale, fresh):
+            with open(path, 'wb') as file:
+                file.write(SMALL_GIF)
+        day_ago = time.time() - 24 * 60 * 60
+        for root, _, files in os.walk(TEMP_MEDIA_ROOT):
+            for name in files:
+                path = os.path.join(root, name)
+                if path != fresh:
+                    os.utime(path, (day_ago, day_ago))
+
+        out = StringIO()
+        call_command('clean_media', '--dry-run', stdout=out)
+        self.assertIn('posts/old.gif', out.getvalue())
+        self.assertIn('cache/aa/stale.jpg', out.getvalue())
+        self.assertTrue(os.path.exists(orphan))
+
+        call_command('clean_media', '--batch-size', '2', stdout=StringIO())
+        self.assertFalse(os.path.exists(orphan))
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(fresh))
+        self.assertTrue(os.path.exists(post.image.path))
+        thumbnail = urls['card']['src'][len(settings.MEDIA_URL):]
+        self.assertTrue(
+            os.path.exists(os.path.join(TEMP_MEDIA_ROOT, thumbnail)))
@@ -0,0 +1,83 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+from .utils import QueryBudgetMixin
+
+User = get_user_model()
+
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    # Сессия и пользователь запроса входят в каждый бюджет; профиль,
+    # группа и пост тратят ещё запрос на id для отметок freshness.
+    budgets = {
+        'posts:index': 4,
+        'posts:group_list': 6,
+        'posts:profile': 8,
+        'posts:follow_index': 5,
+        'posts:post_detail': 5,
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='follower')
+        cls.author = User.objects.create_user(
+            username='author', first_name='Имя', last_name='Фамилия')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            description='Тестовый текст',
+            slug='test-slug',
+        )
+        cls.post = Post.objects.create(
+            text='Тестовый пост',
+            author=cls.author,
+            group=cls.group,
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cls.kwargs = {
+            'posts:index': None,
+            'posts:group_list': {'slug': cls.group.slug},
+            'posts:profile': {'username': cls.author.username},
+            'posts:follow_index': None,
+            'posts:post_detail': {'post_id': cls.post.pk},
+        }
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def fill(self):
+        """Дополняет ленты до полной страницы, а пост — комментариями."""
+        for i in range(settings.COUNT_POSTS):
+            commenter = User.objects.create_user(username=f'user{i}')
+            Post.objects.create(
+                text=f'Тестовый пост {i}',
+                author=self.author,
+                group=self.group,
+            )
+            Comment.objects.create(
+                text=f'Комментарий {i}',
+                post=self.post,
+                author=commenter,
+            )
+
+    def check_budgets(self):
+        for url, budget in self.budgets.items():
+            address = reverse(url, kwargs=self.kwargs[url])
+            with self.subTest(address=address):
+                cache.clear()
+                with self.assertMaxQueries(budget):
+                    self.authorized_client.get(address)
+
+    def test_budget_with_single_post(self):
+        """Страницы укладываются в бюджет запросов."""
+        self.check_budgets()
+
+    def test_budget_does_not_grow_with_page(self):
+        """Число запросов не зависит от числа постов на странице."""
+        self.fill()
+        self.check_budgets()
@@ -0,0 +1,99 @@
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+from ..utils import encode_cursor
+
+User = get_user_model()
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def is_regression(detail):
+    """Полный проход по таблице или сортировка во временном B-дереве."""
+    if 'TEMP B-TREE' in detail:
+        return True
+    return detail.startswith('SCAN') and 'INDEX' not in detail
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN из SQLite')
+class QueryPlanTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='follower')
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            description='Тестовый текст',
+            slug='test-slug',
+        )
+        cls.post = Post.objects.create(
+            text='Тестовый пост',
+            author=cls.author,
+            group=cls.group,
+        )
+        Comment.objects.create(
+            text='Комментарий',
+            post=cls.post,
+            author=cls.user,
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cursor = encode_cursor(cls.post)
+        cls.feeds = (
+            ('posts:index', None),
+            ('posts:group_list', {'slug': cls.group.slug}),
+            ('posts:profile', {'username': cls.author.username}),
+            ('posts:follow_index', None),
+        )
+        cls.queries = ('', '?page=2', f'?after={cursor}',
+                       f'?before={cursor}')
+        cls.pages = (
+            ('posts:post_detail', {'post_id': cls.post.pk}),
+            ('posts:post_comments', {'post_id': cls.post.pk}),
+            ('posts:api_post_comments', {'post_id': cls.post.pk}),
+            ('posts:profile_unfollow', {'username': cls.author.username}),
+            ('posts:profile_follow', {'username': cls.author.username}),
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def assert_no_regressions(self, address):
+        with CaptureQueriesContext(connection) as context:
+            self.authorized_client.get(address)
+        for query in context.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT'):
+                continue
+            plan = explain(sql)
+            self.assertFalse(
+                any(is_regression(detail) for detail in plan),
+                f'{address}: {sql}\n{plan}')
+
+    def test_feeds_use_indexes(self):
+        """Запросы лент не читают таблицу целиком и не сортируют."""
+        for url, kwargs in self.feeds:
+            for query in self.queries:
+                address = reverse(url, kwargs=kwargs) + query
+                with self.subTest(address=address):
+                    self.assert_no_regressions(address)
+
+    def test_pages_use_indexes(self):
+        """Запросы страницы поста и подписок идут по индексам."""
+        for url, kwargs in self.pages:
+            address = reverse(url, kwargs=kwargs)
+            with self.subTest(address=address):
+                self.assert_no_regressions(address)
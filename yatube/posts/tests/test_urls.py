@@ -1,14 +1,20 @@
+import os
+import shutil
+import tempfile
 from http import HTTPStatus
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 
 from ..models import Group, Post
 
 User = get_user_model()
 
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
 
 class PostURLTests(TestCase):
     @classmethod
@@ -84,3 +90,68 @@ class PostURLTests(TestCase):
     def test_unexisting_page(self):
         response = self.guest_client.get('/unexisting_page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaServeTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(os.path.join(TEMP_MEDIA_ROOT, 'posts'), exist_ok=True)
+        cls.content = bytes(range(256)) * 4
+        with open(os.path.join(TEMP_MEDIA_ROOT, 'posts', 'a.gif'),
+                  'wb') as file:
+            file.write(cls.content)
+        cls.url = settings.MEDIA_URL + 'posts/a.gif'
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_full_file(self):
+        """Файл отдаётся целиком с долгим кэшем и валидаторами."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'image/gif')
+        self.assertIn('immutable', response['Cache-Control'])
+        response = self.client.get(
+            self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_range(self):
+        """Range отдаёт только запрошенные байты."""
+        cases = (
+            ('bytes=10-19', 10, 20),
+            ('bytes=1000-', 1000, 1024),
+            ('bytes=-4', 1020, 1024),
+        )
+        for header, start, end in cases:
+            with self.subTest(header=header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.PARTIAL_CONTENT)
+                self.assertEqual(b''.join(response.streaming_content),
+                                 self.content[start:end])
+                self.assertEqual(response['Content-Range'],
+                                 f'bytes {start}-{end - 1}/1024')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code,
+                         HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+
+    def test_paths_outside_media_are_404(self):
+        """Пути вне разрешённых каталогов не отдаются."""
+        for path in ('../settings.py', 'posts/../../manage.py',
+                     'other/a.gif', 'posts/missing.gif', 'posts/'):
+            with self.subTest(path=path):
+                response = self.client.get(settings.MEDIA_URL + path)
+                self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    @override_settings(MEDIA_ACCEL='nginx')
+    def test_accel_redirect(self):
+        """С nginx байты отдаёт фронт-сервер по X-Accel-Redirect."""
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/protected-media/posts/a.gif')
+        self.assertEqual(response.content, b'')
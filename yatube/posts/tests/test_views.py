@@ -1,15 +1,44 @@
+import base64
+import shutil
+import tempfile
+import time
+import warnings
 from http import HTTPStatus
+from io import StringIO
+from unittest import mock
 
 from django import forms
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from django.test import TestCase, Client
+from django.core.cache.backends.base import CacheKeyWarning
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.paginator import Paginator
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 
-from ..models import Group, Post, Follow
+from core import throttling
+from core.templatetags.pagination import page_window
+from .. import follows, freshness, graph, live, suggestions, thumbnails
+from ..caching import bump_generation
+from ..models import Comment, Group, Post, Follow, TimelineEntry
+from ..templatetags.post_cards import card_key
+from ..utils import FeedPaginator, decode_cursor, encode_cursor
 
 User = get_user_model()
 
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
 
 class PostViewTests(TestCase):
     @classmethod
@@ -173,6 +202,56 @@ class PaginatorViewsTest(TestCase):
             reverse('posts:follow_index') + '?page=2')
         self.assertEqual(len(response.context['page_obj']), 3)
 
+    def test_page_window(self):
+        """Окно номеров страниц не растёт вместе с числом страниц."""
+        paginator = Paginator(range(1000), 1)
+        self.assertEqual(
+            page_window(paginator.page(500), 2),
+            [1, None, 498, 499, 500, 501, 502, None, 1000])
+        self.assertEqual(page_window(paginator.page(2), 2),
+                         [1, 2, 3, 4, None, 1000])
+
+    def test_count_cached_within_generation(self):
+        """Число постов берётся из кэша, пока контент не изменился."""
+        posts = Post.objects.all()
+        self.assertEqual(FeedPaginator(posts, 10).count, 13)
+        Post.objects.bulk_create([
+            Post(text='Тестовый текст', author=self.author)])
+        self.assertEqual(FeedPaginator(posts, 10).count, 13)
+        bump_generation()
+        self.assertEqual(FeedPaginator(posts, 10).count, 14)
+
+    @override_settings(CURSOR_PAGINATION=True)
+    def test_cursor_pages(self):
+        """Курсорная пагинация отдаёт страницы по after/before."""
+        for url, slug in self.urls_common:
+            reverse_name = reverse(url, kwargs=slug)
+            with self.subTest(reverse_name=reverse_name):
+                first = self.client.get(reverse_name).context['page_obj']
+                self.assertEqual(len(first), 10)
+                self.assertFalse(first.has_previous())
+                second = self.client.get(
+                    reverse_name + f'?after={first.next_cursor}'
+                ).context['page_obj']
+                self.assertEqual(len(second), 3)
+                self.assertFalse(second.has_next())
+                back = self.client.get(
+                    reverse_name + f'?before={second.previous_cursor}'
+                ).context['page_obj']
+                self.assertEqual(list(back), list(first))
+
+    @override_settings(CURSOR_PAGINATION=True)
+    def test_broken_cursor_gives_first_page(self):
+        """Наивная дата и id вне 64 бит в курсоре — первая страница."""
+        for raw in ('2020-01-01T00:00:00|1',
+                    '2020-01-01T00:00:00+00:00|' + '9' * 23):
+            token = base64.urlsafe_b64encode(raw.encode()).decode()
+            with self.subTest(raw=raw):
+                self.assertIsNone(decode_cursor(token))
+                response = self.client.get(
+                    reverse('posts:index'), {'after': token})
+                self.assertFalse(response.context['page_obj'].has_previous())
+
 
 class PostCacheTest(TestCase):
     @classmethod
@@ -197,16 +276,185 @@ class PostCacheTest(TestCase):
         self.authorized_client.force_login(self.user)
 
     def test_index_cache(self):
+        """Главная берётся из кэша, пока контент не изменился."""
         response = self.authorized_client.get(reverse('posts:index'))
-        post = self.post
-        post.text = 'Изменённый пост',
-        post.save()
+        Post.objects.filter(pk=self.post.pk).update(text='Изменённый пост')
         response_2 = self.authorized_client.get(reverse('posts:index'))
         self.assertEqual(response.content, response_2.content)
         cache.clear()
         response_3 = self.authorized_client.get(reverse('posts:index'))
         self.assertNotEqual(response.content, response_3.content)
 
+    def test_index_cache_invalidated_on_save(self):
+        """Сохранение поста сразу сбрасывает закэшированные страницы."""
+        response = self.authorized_client.get(reverse('posts:index'))
+        post = self.post
+        post.text = 'Изменённый пост'
+        post.save()
+        response_2 = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotEqual(response.content, response_2.content)
+        self.assertContains(response_2, 'Изменённый пост')
+
+    def test_index_pages_cached_separately(self):
+        """Разные страницы главной не подменяют друг друга в кэше."""
+        cache.clear()
+        Post.objects.bulk_create([
+            Post(text=f'Пост {i}', author=self.user)
+            for i in range(settings.COUNT_POSTS)
+        ])
+        first = self.authorized_client.get(reverse('posts:index'))
+        second = self.authorized_client.get(reverse('posts:index') + '?page=2')
+        self.assertNotEqual(first.content, second.content)
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            description='Тестовый текст',
+            slug='test-slug',
+        )
+        cls.post = Post.objects.create(
+            text='Тестовый пост',
+            author=cls.user,
+            group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_card_shared_between_feeds(self):
+        """Карточка, отрисованная в одной ленте, берётся из кэша в другой."""
+        self.client.get(reverse('posts:index'))
+        key = card_key(Post.objects.select_related(
+            'author', 'group').get(pk=self.post.pk))
+        cache.set(key, '<article>из кэша</article>')
+        response = self.client.get(
+            reverse('posts:group_list', args=(self.group.slug,)))
+        self.assertContains(response, 'из кэша')
+
+    def test_card_version_changes_on_edit(self):
+        """Правка поста меняет ключ карточки."""
+        post = Post.objects.select_related('author', 'group').get(
+            pk=self.post.pk)
+        key = card_key(post)
+        post.text = 'Изменённый пост'
+        self.assertNotEqual(card_key(post), key)
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            description='Тестовый текст',
+            slug='test-slug',
+        )
+        cls.post = Post.objects.create(
+            text='Тестовый пост',
+            author=cls.user,
+            group=cls.group)
+        cls.urls = (
+            reverse('posts:post_detail', args=(cls.post.pk,)),
+            reverse('posts:profile', args=(cls.user.username,)),
+            reverse('posts:group_list', args=(cls.group.slug,)),
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_not_modified(self):
+        """Повторный запрос с ETag получает 304 без тела."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.NOT_MODIFIED)
+                self.assertEqual(response.content, b'')
+
+    def test_modified_after_change(self):
+        """Изменение поста меняет валидаторы всех его страниц."""
+        etags = [self.authorized_client.get(url)['ETag']
+                 for url in self.urls]
+        Comment.objects.create(
+            text='Комментарий', post=self.post, author=self.user)
+        self.post.text = 'Изменённый пост'
+        self.post.save()
+        for url, etag in zip(self.urls, etags):
+            with self.subTest(url=url):
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_new_csrf_token_changes_etag(self):
+        """После повторного входа страница с формой не отвечает 304."""
+        url = self.urls[0]
+        etag = self.authorized_client.get(url)['ETag']
+        self.authorized_client.logout()
+        self.authorized_client.force_login(self.user)
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_group_change_refreshes_post_pages(self):
+        """Переименование группы меняет валидаторы поста и профиля."""
+        etags = [self.authorized_client.get(url)['ETag']
+                 for url in self.urls[:2]]
+        self.group.title = 'Новое название'
+        self.group.save()
+        for url, etag in zip(self.urls, etags):
+            with self.subTest(url=url):
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_last_modified_only_for_settled_anonymous(self):
+        """Last-Modified есть только у анонимов и только когда секунда
+        отметки прошла."""
+        url = self.urls[0]
+        now = int(time.time()) + 10.5
+        with mock.patch.object(freshness.time, 'time', lambda: now):
+            response = self.client.get(url)
+            self.assertFalse(response.has_header('Last-Modified'))
+            now += 1
+            modified = self.client.get(url)['Last-Modified']
+            response = self.authorized_client.get(url)
+            self.assertFalse(response.has_header('Last-Modified'))
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=modified)
+            self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+            Comment.objects.create(
+                text='Комментарий', post=self.post, author=self.user)
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=modified)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_stamps_keyed_by_pk(self):
+        """Кириллические username и slug не попадают в ключи кэша."""
+        author = User.objects.create_user(username='Автор')
+        group = Group.objects.create(
+            title='Группа', description='Описание', slug='Группа')
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always', CacheKeyWarning)
+            Post.objects.create(text='Пост', author=author)
+            Post.objects.create(text='Пост', author=self.user, group=group)
+            response = self.client.get(
+                reverse('posts:profile', args=(author.username,)))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertFalse(
+            [w for w in caught if issubclass(w.category, CacheKeyWarning)])
+
+    def test_missing_object_is_404(self):
+        """Для несуществующего объекта валидаторов нет, ответ 404."""
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', args=(self.post.pk + 100,)))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
 
 class FollowTest(TestCase):
     @classmethod
@@ -260,3 +508,499 @@ class FollowTest(TestCase):
         response = self.authorized_client_following.get(
             reverse('posts:follow_index'))
         self.assertNotContains(response, 'Тестовый пост')
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='follower')
+        cls.author = User.objects.create_user(username='following')
+        cls.post = Post.objects.create(
+            text='Старый пост',
+            author=cls.author,
+        )
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        """Подписка заполняет ленту, отписка её очищает."""
+        self.authorized_client.get(
+            reverse('posts:profile_follow', args=(self.author.username,)))
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.user, post=self.post).exists())
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow', args=(self.author.username,)))
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.user).exists())
+
+    def test_new_post_fans_out(self):
+        """Новый пост попадает в ленты подписчиков автора."""
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user, post=post).exists())
+
+    def test_rebuild_timelines_command(self):
+        """Команда rebuild_timelines восстанавливает ленты."""
+        Follow.objects.create(user=self.user, author=self.author)
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.user).count(),
+            self.author.posts.count())
+
+    def test_rebuild_in_batches_drops_stale_entries(self):
+        """Пересборка пачками убирает лишнее и не трогает чужие ленты."""
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=other, author=self.author)
+        # Запись без подписки, например после сбоя сигнала.
+        TimelineEntry.objects.create(
+            user=self.user, post=self.post, author=self.author,
+            pub_date=self.post.pub_date)
+        call_command('rebuild_timelines', batch_size=1, stdout=StringIO())
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.user).exists())
+        self.assertTrue(TimelineEntry.objects.filter(user=other).exists())
+
+
+@mock.patch.object(graph.transaction, 'on_commit', lambda func: func())
+class FollowGraphTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='follower')
+        cls.authors = [User.objects.create_user(username=f'author{i}')
+                       for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_lazy_rebuild_and_lookups(self):
+        """Граф собирается одним запросом и дальше читается из кэша."""
+        first, second, third = self.authors
+        Follow.objects.create(user=self.user, author=third)
+        Follow.objects.create(user=self.user, author=first)
+        with self.assertNumQueries(1):
+            self.assertEqual(list(graph.following_ids(self.user.pk)),
+                             sorted([first.pk, third.pk]))
+        with self.assertNumQueries(0):
+            self.assertTrue(graph.is_following(self.user.pk, first.pk))
+            self.assertFalse(graph.is_following(self.user.pk, second.pk))
+            self.assertEqual(graph.following_count(self.user.pk), 2)
+            self.assertEqual(
+                graph.following_flags(
+                    self.user.pk, [a.pk for a in self.authors]),
+                {first.pk, third.pk})
+            self.assertFalse(graph.is_following(None, first.pk))
+
+    def test_follow_and_unfollow_update_graph(self):
+        """Подписка и отписка правят граф в кэше, не сбрасывая его."""
+        author = self.authors[0]
+        graph.following_ids(self.user.pk)
+        self.authorized_client.get(
+            reverse('posts:profile_follow', args=(author.username,)))
+        with self.assertNumQueries(0):
+            self.assertTrue(graph.is_following(self.user.pk, author.pk))
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow', args=(author.username,)))
+        with self.assertNumQueries(0):
+            self.assertFalse(graph.is_following(self.user.pk, author.pk))
+
+    def test_bulk_follow_updates_graph(self):
+        """Пакетная подписка и отписка тоже попадают в граф."""
+        graph.following_ids(self.user.pk)
+        edges = [(self.user.pk, author.pk) for author in self.authors]
+        follows.follow_many(edges)
+        self.assertEqual(graph.following_count(self.user.pk), 3)
+        follows.unfollow_many(edges[:2])
+        with self.assertNumQueries(0):
+            self.assertEqual(list(graph.following_ids(self.user.pk)),
+                             [self.authors[2].pk])
+
+
+class SuggestionTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader, cls.second, cls.third = (
+            User.objects.create_user(username=f'reader{i}')
+            for i in range(3))
+        cls.x, cls.y, cls.z = (
+            User.objects.create_user(username=name)
+            for name in ('x', 'y', 'z'))
+        follows.follow_many([
+            (cls.reader.pk, cls.x.pk),
+            (cls.second.pk, cls.x.pk), (cls.second.pk, cls.y.pk),
+            (cls.third.pk, cls.x.pk), (cls.third.pk, cls.y.pk),
+            (cls.third.pk, cls.z.pk),
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+        call_command('build_suggestions', chunk_size=2, stdout=StringIO())
+
+    def test_suggestions_ranked_by_co_follows(self):
+        """Авторы ранжируются по числу общих подписчиков."""
+        self.assertEqual(suggestions.for_user(self.reader),
+                         [self.y, self.z])
+        self.assertEqual(suggestions.similar_to(self.x), [self.y, self.z])
+        self.assertEqual(suggestions.for_user(self.third), [])
+
+    def test_pages_show_suggestions(self):
+        """Рекомендации видны в ленте подписок и в профиле автора."""
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['suggested'], [self.y, self.z])
+        response = self.authorized_client.get(
+            reverse('posts:profile', args=(self.x.username,)))
+        self.assertContains(
+            response, reverse('posts:profile', args=(self.y.username,)))
+
+    def test_new_follows_and_stale_rows(self):
+        """Свежие подписки отсекаются, устаревшие строки удаляются."""
+        Follow.objects.create(user=self.reader, author=self.y)
+        cache.clear()
+        self.assertEqual(suggestions.for_user(self.reader), [self.z])
+        Follow.objects.filter(user=self.reader).delete()
+        call_command('build_suggestions', stdout=StringIO())
+        self.assertEqual(suggestions.for_user(self.reader), [])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(
+            text='Пост с картинкой',
+            author=cls.user,
+            image=SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif'),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_placeholder_until_ready(self):
+        """До готовности миниатюр страницы показывают заглушку."""
+        for address in (reverse('posts:index'),
+                        reverse('posts:post_detail', args=(self.post.pk,))):
+            with self.subTest(address=address):
+                response = self.client.get(address)
+                self.assertContains(response, 'aspect-ratio')
+                self.assertNotContains(response, '<img class="card-img')
+
+    def test_ready_thumbnails_shown(self):
+        """Готовые миниатюры попадают в ленту и на страницу поста."""
+        self.client.get(reverse('posts:index'))
+        urls = thumbnails.generate(self.post.image.name)
+        self.assertEqual(set(urls), set(thumbnails.VARIANTS))
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, urls['card']['src'])
+        self.assertContains(response, f'srcset="{urls["card"]["srcset"]}"')
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,)))
+        self.assertContains(response, urls['detail']['src'])
+
+    def test_image_metadata_stored_on_upload(self):
+        """Размеры, цвет и превью сохраняются при загрузке и видны в html."""
+        self.assertEqual((self.post.image_width, self.post.image_height),
+                         (2, 1))
+        self.assertRegex(self.post.image_color, r'^#[0-9a-f]{6}$')
+        self.assertTrue(
+            self.post.image_placeholder.startswith('data:image/png;base64,'))
+        self.assertLess(len(self.post.image_placeholder), 1024)
+        thumbnails.generate(self.post.image.name)
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,)))
+        self.assertContains(response, 'width="960" height="339"')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, self.post.image_placeholder)
+
+    def test_build_thumbnails_describes_old_posts(self):
+        """build_thumbnails заполняет описание картинок старых постов."""
+        Post.objects.filter(pk=self.post.pk).update(
+            image_width=None, image_height=None, image_color='',
+            image_placeholder='')
+        call_command('build_thumbnails', stdout=StringIO())
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.image_color, self.post.image_color)
+        self.assertEqual(post.image_width, 2)
+
+    def test_srcset_widths(self):
+        """srcset перечисляет все ширины, JPEG есть всегда."""
+        urls = thumbnails.generate(self.post.image.name)
+        for variant in thumbnails.VARIANTS:
+            with self.subTest(variant=variant):
+                srcset = urls[variant]['srcset']
+                for width in thumbnails.WIDTHS:
+                    self.assertIn(f' {width}w', srcset)
+                self.assertTrue(urls[variant]['src'].endswith('.jpg'))
+                self.assertEqual(
+                    bool(urls[variant]['webp']), 'WEBP' in thumbnails.FORMATS)
+
+    def test_thumbnails_survive_cache_loss(self):
+        """Готовые миниатюры читаются из базы, если кэш их потерял."""
+        urls = thumbnails.generate(self.post.image.name)
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                thumbnails.urls_for([self.post.image.name, 'posts/nope.gif']),
+                {self.post.image.name: urls})
+        with self.assertNumQueries(0):
+            thumbnails.urls_for([self.post.image.name, 'posts/nope.gif'])
+
+    def test_upload_schedules_thumbnails(self):
+        """Сохранение картинки ставит миниатюры в очередь, текст — нет."""
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                {'text': 'Ещё пост', 'image': SimpleUploadedFile(
+                    'other.gif', SMALL_GIF, 'image/gif')})
+            self.assertEqual(schedule.call_count, 1)
+            self.authorized_client.post(
+                reverse('posts:post_edit', args=(self.post.pk,)),
+                {'text': 'Новый текст'})
+            self.assertEqual(schedule.call_count, 1)
+
+    def test_build_thumbnails_command(self):
+        """Команда build_thumbnails строит недостающие миниатюры."""
+        call_command('build_thumbnails', stdout=StringIO())
+        self.assertTrue(thumbnails.urls_for([self.post.image.name]))
+
+
+class CommentsPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(text='Вирусный пост', author=cls.user)
+        for number in range(settings.COUNT_COMMENTS + 5):
+            Comment.objects.create(
+                text=f'Комментарий {number}', post=cls.post, author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_first_batch_on_post_page(self):
+        """На странице поста только первая пачка и ссылка на следующую."""
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,)))
+        comments = response.context['comments']
+        self.assertEqual(len(comments), settings.COUNT_COMMENTS)
+        self.assertEqual(comments[0].text, 'Комментарий 0')
+        self.assertContains(response, 'js-more-comments')
+
+    def test_load_more_fragment(self):
+        """Фрагмент продолжает с курсора и без ссылки в конце."""
+        last = self.post.comments.order_by('created', 'pk')[
+            settings.COUNT_COMMENTS - 1]
+        response = self.client.get(
+            reverse('posts:post_comments', args=(self.post.pk,)),
+            {'after': encode_cursor(last, ('created', 'pk'))})
+        self.assertEqual(len(response.context['comments']), 5)
+        self.assertContains(response, 'Комментарий 24')
+        self.assertNotContains(response, 'Комментарий 19')
+        self.assertNotContains(response, 'js-more-comments')
+        self.assertNotContains(response, '<html')
+
+    def test_api_comments(self):
+        """JSON-пачки комментариев в API идут от новых к старым."""
+        response = self.client.get(
+            reverse('posts:api_post_comments', args=(self.post.pk,)),
+            {'fields': 'text'})
+        data = response.json()
+        self.assertEqual(data['results'][0], {'text': 'Комментарий 24'})
+        self.assertEqual(len(data['results']), settings.COUNT_COMMENTS)
+        self.assertIsNotNone(data['next'])
+
+    def test_new_comment_redirects_to_its_batch(self):
+        """После комментария открывается пачка, где он виден."""
+        response = self.authorized_client.post(
+            reverse('posts:add_comment', args=(self.post.pk,)),
+            {'text': 'Свежий комментарий'}, follow=True)
+        self.assertContains(response, 'Свежий комментарий')
+
+
+@override_settings(LIVE_COMMENTS_STREAM=True, LIVE_COMMENTS_TIMEOUT=0)
+@mock.patch.object(live.transaction, 'on_commit', lambda func: func())
+class LiveCommentsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(text='Живой пост', author=cls.user)
+        cls.first = Comment.objects.create(
+            text='Старый комментарий', post=cls.post, author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.url = reverse('posts:post_comments_live', args=(self.post.pk,))
+
+    def read(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_stream_sends_comments_after_since(self):
+        """Поток отдаёт только комментарии новее since."""
+        self.authorized_client.post(
+            reverse('posts:add_comment', args=(self.post.pk,)),
+            {'text': 'Новый комментарий'})
+        response = self.client.get(self.url, {'since': self.first.pk})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = self.read(response)
+        self.assertIn('event: comment', body)
+        self.assertIn('Новый комментарий', body)
+        self.assertNotIn('Старый комментарий', body)
+
+    def test_last_event_id_and_default_start(self):
+        """Без since поток начинается с последнего комментария."""
+        body = self.read(self.client.get(self.url))
+        self.assertNotIn('event: comment', body)
+        body = self.read(self.client.get(self.url, HTTP_LAST_EVENT_ID='0'))
+        self.assertIn(f'id: {self.first.pk}', body)
+
+    def test_publish_wakes_local_subscribers(self):
+        """Сохранение комментария будит очереди этого процесса."""
+        with live.subscribe(self.post.pk) as inbox:
+            comment = Comment.objects.create(
+                text='Ещё один', post=self.post, author=self.user)
+            self.assertEqual(inbox.get_nowait(), comment.pk)
+        self.assertEqual(live.latest(self.post.pk), comment.pk)
+        self.assertNotIn(self.post.pk, live._subscribers)
+
+    def test_post_page_points_to_stream(self):
+        """Страница поста знает адрес потока и последний комментарий."""
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,)))
+        self.assertContains(response, f'data-stream="{self.url}"')
+        self.assertContains(response, f'data-last-id="{self.first.pk}"')
+
+    @override_settings(LIVE_COMMENTS_STREAM=False)
+    def test_stream_disabled_by_default(self):
+        """Без настройки потока нет, страница только опрашивает."""
+        self.assertEqual(self.client.get(self.url).status_code,
+                         HTTPStatus.NOT_FOUND)
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,)))
+        self.assertNotContains(response, 'data-stream')
+        self.assertContains(response, reverse(
+            'posts:post_comments_latest', args=(self.post.pk,)))
+
+    @override_settings(LIVE_COMMENTS_MAX_STREAMS_PER_IP=1)
+    def test_streams_per_ip_capped(self):
+        """Второй поток с того же адреса получает 429, пока первый
+        открыт."""
+        first = self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, HTTPStatus.TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+        first.close()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        response.close()
+        self.assertFalse(live._streams)
+
+    def test_latest_and_new_comments(self):
+        """Опрос: id последнего комментария и фрагмент после since."""
+        url = reverse('posts:post_comments_latest', args=(self.post.pk,))
+        response = self.client.get(url)
+        self.assertEqual(response.json(), {'latest': self.first.pk})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        comment = Comment.objects.create(
+            text='Новый комментарий', post=self.post, author=self.user)
+        response = self.client.get(
+            reverse('posts:post_comments', args=(self.post.pk,)),
+            {'since': self.first.pk})
+        self.assertContains(response, f'id="comment-{comment.pk}"')
+        self.assertNotContains(response, 'Старый комментарий')
+
+    def test_out_of_range_since(self):
+        """id вне 64 бит в since не роняет ни фрагмент, ни поток."""
+        huge = '9' * 23
+        response = self.client.get(
+            reverse('posts:post_comments', args=(self.post.pk,)),
+            {'since': huge})
+        self.assertContains(response, 'Старый комментарий')
+        body = self.read(self.client.get(
+            self.url, HTTP_LAST_EVENT_ID='-' + huge))
+        self.assertNotIn('event: comment', body)
+
+
+class ThrottleTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='spammer')
+        cls.other = User.objects.create_user(username='neighbour')
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def comment(self):
+        return self.authorized_client.post(
+            reverse('posts:add_comment', args=(self.post.pk,)),
+            {'text': 'Спам'})
+
+    @override_settings(THROTTLE_RATES={'add_comment': {'user': (2, 60)}})
+    def test_user_bucket_and_refill(self):
+        """Сверх ёмкости ведра — 429 без записи, со временем токены
+        возвращаются."""
+        now = 1_000_000.0
+        with mock.patch.object(throttling.time, 'time', lambda: now):
+            for _ in range(2):
+                self.assertEqual(self.comment().status_code,
+                                 HTTPStatus.FOUND)
+            response = self.comment()
+            self.assertEqual(response.status_code,
+                             HTTPStatus.TOO_MANY_REQUESTS)
+            self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(self.post.comments.count(), 2)
+        now += 30
+        with mock.patch.object(throttling.time, 'time', lambda: now):
+            self.assertEqual(self.comment().status_code, HTTPStatus.FOUND)
+            self.assertEqual(self.comment().status_code,
+                             HTTPStatus.TOO_MANY_REQUESTS)
+
+    @override_settings(THROTTLE_RATES={'follow': {'ip': (1, 60)}})
+    def test_ip_bucket_shared_by_users(self):
+        """Ведро IP общее для всех пользователей с этого адреса."""
+        url = reverse('posts:profile_follow', args=(self.author.username,))
+        self.assertEqual(self.authorized_client.get(url).status_code,
+                         HTTPStatus.FOUND)
+        other_client = Client()
+        other_client.force_login(self.other)
+        self.assertEqual(other_client.get(url).status_code,
+                         HTTPStatus.TOO_MANY_REQUESTS)
+        self.assertFalse(
+            Follow.objects.filter(user=self.other).exists())
+
+    @override_settings(THROTTLE_RATES={'post_create': {'user': (1, 60)}})
+    def test_only_listed_methods_are_throttled(self):
+        """Форма создания поста открывается без ограничений."""
+        url = reverse('posts:post_create')
+        for _ in range(3):
+            self.assertEqual(self.authorized_client.get(url).status_code,
+                             HTTPStatus.OK)
@@ -0,0 +1,32 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+class _AssertMaxQueriesContext(CaptureQueriesContext):
+    def __init__(self, test_case, budget, connection):
+        self.test_case = test_case
+        self.budget = budget
+        super().__init__(connection)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return
+        executed = len(self)
+        queries = '\n'.join(
+            f'{i}. {query["sql"]}'
+            for i, query in enumerate(self.captured_queries, start=1))
+        self.test_case.assertLessEqual(
+            executed, self.budget,
+            f'{executed} запросов при бюджете {self.budget}:\n{queries}')
+
+
+class QueryBudgetMixin:
+    """Проверка, что код укладывается в бюджет SQL-запросов.
+
+    В отличие от assertNumQueries, бюджет — верхняя граница: тест не
+    ломается, когда число запросов уменьшается.
+    """
+
+    def assertMaxQueries(self, budget, using=DEFAULT_DB_ALIAS):
+        return _AssertMaxQueriesContext(self, budget, connections[using])
@@ -0,0 +1,199 @@
+"""Миниатюры постов, подготовленные заранее.
+
+sorl строит миниатюру лениво, в первом запросе, который её показывает.
+Здесь все варианты из VARIANTS строятся в пуле потоков после фиксации
+транзакции, сохранившей картинку. Адреса готовых миниатюр записываются
+в хранилище ключей sorl (кэш с копией в базе, см. kvstore); шаблоны
+только читают их оттуда, а пока миниатюр нет, показывают заглушку.
+"""
+import base64
+import hashlib
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageFilter, features
+from sorl.thumbnail import default, delete, get_thumbnail
+from sorl.thumbnail.kvstores.base import add_prefix
+
+from . import freshness
+from .caching import bump_generation
+from .models import Post, StoredImage
+from .storage import lock
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = {
+    'card': ('960x400', {'crop': 'center', 'upscale': True}),
+    'detail': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+
+# Ширины для srcset; пропорции берутся из геометрии варианта.
+WIDTHS = (480, 720, 960)
+
+# WebP отдаётся браузерам, которые его понимают, JPEG — остальным.
+# Если Pillow собран без libwebp, строится только JPEG.
+FORMATS = ('WEBP', 'JPEG') if features.check('webp') else ('JPEG',)
+
+# Сторона размытой превью: PNG такого размера занимает пару сотен байт.
+PLACEHOLDER_SIZE = 16
+
+# Без потоков (THUMBNAIL_WORKERS = 0) миниатюры строятся прямо в
+# on_commit: так задача не переживает запрос или тест.
+_executor = ThreadPoolExecutor(
+    max_workers=settings.THUMBNAIL_WORKERS,
+    thread_name_prefix='thumbnails',
+) if settings.THUMBNAIL_WORKERS else None
+
+
+def ready_key(name):
+    return add_prefix(hashlib.md5(name.encode()).hexdigest(), 'post-images')
+
+
+def describe(file):
+    """Размеры, основной цвет и размытая превью картинки для полей Post."""
+    file.seek(0)
+    with Image.open(file) as image:
+        width, height = image.size
+        image.draft('RGB', (PLACEHOLDER_SIZE * 8, PLACEHOLDER_SIZE * 8))
+        small = image.convert('RGB')
+    file.seek(0)
+    small.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    _, color = max(small.quantize(colors=4).convert('RGB').getcolors())
+    buffer = BytesIO()
+    small.filter(ImageFilter.GaussianBlur(1)).save(
+        buffer, 'PNG', optimize=True)
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_color': '#{:02x}{:02x}{:02x}'.format(*color),
+        'image_placeholder': 'data:image/png;base64,'
+        + base64.b64encode(buffer.getvalue()).decode(),
+    }
+
+
+def _srcset(name, geometry, image_format, options):
+    full_width, full_height = map(int, geometry.split('x'))
+    candidates = []
+    for width in WIDTHS:
+        height = round(width * full_height / full_width)
+        thumbnail = get_thumbnail(
+            name, f'{width}x{height}', format=image_format, **options)
+        if not thumbnail.exists():
+            raise FileNotFoundError(name)
+        candidates.append(f'{thumbnail.url} {width}w')
+    return candidates
+
+
+def _build(name, geometry, options):
+    """src, srcset и webp (srcset в WebP или '') одного варианта."""
+    sets = {image_format: _srcset(name, geometry, image_format, options)
+            for image_format in FORMATS}
+    jpeg = sets['JPEG']
+    return {
+        'src': jpeg[-1].rsplit(' ', 1)[0],
+        'srcset': ', '.join(jpeg),
+        'webp': ', '.join(sets.get('WEBP', ())),
+    }
+
+
+def generate(name, stamps=()):
+    """Строит все варианты и возвращает {вариант: {src, srcset, webp}}.
+
+    stamps — имена отметок freshness, которые нужно обновить, чтобы
+    страницы с заглушкой не отвечали 304.
+    """
+    urls = {variant: _build(name, geometry, options)
+            for variant, (geometry, options) in VARIANTS.items()}
+    default.kvstore.set_raw(ready_key(name), json.dumps(urls))
+    # Карточки и страницы с заглушкой пора перерисовать.
+    bump_generation()
+    freshness.touch(*stamps)
+    return urls
+
+
+def _generate_logged(name, stamps):
+    try:
+        generate(name, stamps)
+    except Exception:
+        logger.exception('Не удалось построить миниатюры %s', name)
+
+
+def _generate_in_worker(name, stamps):
+    try:
+        _generate_logged(name, stamps)
+    finally:
+        close_old_connections()
+
+
+def schedule(post):
+    """Ставит построение миниатюр поста в пул после фиксации транзакции."""
+    name = post.image.name
+    # Повторная загрузка того же файла получает то же имя (см. storage),
+    # и миниатюры у неё уже есть.
+    if not name or urls_for([name]):
+        return
+    stamps = [f'post:{post.pk}', f'author:{post.author_id}']
+    if post.group_id:
+        stamps.append(f'group:{post.group_id}')
+    transaction.on_commit(lambda: _submit(name, stamps))
+
+
+def _submit(name, stamps):
+    if _executor is None:
+        _generate_logged(name, stamps)
+    else:
+        _executor.submit(_generate_in_worker, name, stamps)
+
+
+def urls_for(names):
+    """Готовые миниатюры для нескольких картинок одним пакетным чтением."""
+    keys = {ready_key(name): name for name in names if name}
+    if not keys:
+        return {}
+    found = default.kvstore.get_many_raw(list(keys))
+    return {keys[key]: json.loads(urls) for key, urls in found.items()}
+
+
+def release(name):
+    """Удаляет картинку и миниатюры, если на неё не ссылается ни один пост.
+
+    Число ссылок — это число постов с таким image, индекс post_image_idx
+    делает проверку дешёвой. Проверка и удаление идут под блокировкой
+    storage.lock, той же, что берёт загрузка файла с тем же содержимым.
+    """
+    if not name:
+        return False
+    with transaction.atomic():
+        lock(name)
+        if Post.objects.filter(image=name).exists():
+            return False
+        StoredImage.objects.filter(name=name).delete()
+        purge(name)
+    return True
+
+
+def purge(name):
+    """Удаляет картинку, её миниатюры и записи о них без проверок."""
+    default.kvstore.delete_raw(ready_key(name))
+    delete(name)
+
+
+def _release_logged(name):
+    try:
+        release(name)
+    except Exception:
+        logger.exception('Не удалось освободить картинку %s', name)
+
+
+def schedule_release(name):
+    """Освобождает картинку после фиксации транзакции.
+
+    После отката пост остался бы без файла, а ошибка удаления не должна
+    ронять уже выполненный запрос.
+    """
+    if name:
+        transaction.on_commit(lambda: _release_logged(name))
@@ -0,0 +1,115 @@
+"""Материализованные ленты подписок (fan-out on write).
+
+Каждый новый пост раскладывается в ленты подписчиков автора, поэтому
+страница /follow/ читает одну ленту по индексу (user, -pub_date, -post)
+вместо соединения Post и Follow.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import Follow, Post, TimelineEntry, User
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _store(entries):
+    for batch in _batched(entries, settings.TIMELINE_BATCH_SIZE):
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out(post):
+    """Добавляет пост в ленты всех подписчиков автора."""
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    _store(
+        TimelineEntry(user_id=user_id, post_id=post.pk,
+                      author_id=post.author_id, pub_date=post.pub_date)
+        for user_id in followers.iterator()
+    )
+
+
+def backfill(user_id, author_id):
+    """Заполняет ленту читателя постами автора после подписки."""
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'pk', 'pub_date')
+    _store(
+        TimelineEntry(user_id=user_id, post_id=post_id,
+                      author_id=author_id, pub_date=pub_date)
+        for post_id, pub_date in posts.iterator()
+    )
+
+
+def backfill_many(edges):
+    """backfill для пачки подписок (user_id, author_id) одним запросом."""
+    followers = {}
+    for user_id, author_id in edges:
+        followers.setdefault(author_id, []).append(user_id)
+    posts = Post.objects.filter(author_id__in=followers).values_list(
+        'author_id', 'pk', 'pub_date')
+    _store(
+        TimelineEntry(user_id=user_id, post_id=post_id,
+                      author_id=author_id, pub_date=pub_date)
+        for author_id, post_id, pub_date in posts.iterator()
+        for user_id in followers[author_id]
+    )
+
+
+def prune_many(edges):
+    """prune для пачки подписок: один DELETE на читателя."""
+    authors = {}
+    for user_id, author_id in edges:
+        authors.setdefault(user_id, []).append(author_id)
+    for user_id, author_ids in authors.items():
+        TimelineEntry.objects.filter(
+            user_id=user_id, author_id__in=author_ids).delete()
+
+
+def prune(user_id, author_id):
+    """Убирает посты автора из ленты читателя после отписки."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild(user_ids=None, batch_size=100):
+    """Пересобирает ленты с нуля по таблице Follow.
+
+    Ленты пересобираются пачками по batch_size читателей, каждая пачка —
+    в своей транзакции: остальные ленты всё это время остаются целыми,
+    а сбой откатывает только незаконченную пачку.
+    """
+    if user_ids is None:
+        user_ids = User.objects.order_by('pk').values_list(
+            'pk', flat=True).iterator()
+    for batch in _batched(user_ids, batch_size):
+        with transaction.atomic():
+            TimelineEntry.objects.filter(user_id__in=batch).delete()
+            backfill_many(Follow.objects.filter(
+                user_id__in=batch).values_list('user_id', 'author_id'))
+
+
+# Ключи курсора ленты: сортировка идёт по полям самой ленты, чтобы
+# страница читалась по её индексу без сортировки.
+CURSOR_KEYS = ('feed_date', 'feed_post')
+
+
+def feed_for(user):
+    """Посты ленты подписок пользователя."""
+    return Post.objects.filter(timeline_entries__user=user).annotate(
+        feed_date=F('timeline_entries__pub_date'),
+        feed_post=F('timeline_entries__post_id'),
+    ).order_by('-feed_date', '-feed_post')
+
+
+def feed_count(user):
+    """Размер ленты по её собственному индексу, без соединения с Post."""
+    return TimelineEntry.objects.filter(user=user).count()
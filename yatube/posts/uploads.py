@@ -0,0 +1,70 @@
+"""Потоковая проверка загружаемых картинок.
+
+Обработчик стоит первым в FILE_UPLOAD_HANDLERS и видит каждый кусок
+файла раньше штатных. Он считает байты и разбирает заголовок картинки
+по мере поступления, поэтому слишком большой файл, неизвестный формат
+или «бомба» с огромным числом пикселей отбрасываются до того, как тело
+окажется в памяти или во временном файле. Причина отказа остаётся
+в request.upload_errors, откуда её забирает форма.
+"""
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.template.defaultfilters import filesizeformat
+from PIL import ImageFile
+
+# Столько байт достаточно, чтобы дойти до размеров картинки даже
+# за крупным блоком EXIF.
+HEADER_LIMIT = 256 * 1024
+
+
+class ImageUploadHandler(FileUploadHandler):
+    def __init__(self, request=None):
+        super().__init__(request)
+        if request is not None and not hasattr(request, 'upload_errors'):
+            request.upload_errors = {}
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.parser = ImageFile.Parser()
+        self.header_checked = False
+        if (self.content_length
+                and self.content_length > settings.MAX_IMAGE_UPLOAD_SIZE):
+            self.reject(self.too_large())
+
+    def too_large(self):
+        return 'Файл больше {}.'.format(
+            filesizeformat(settings.MAX_IMAGE_UPLOAD_SIZE))
+
+    def reject(self, message):
+        if self.request is not None:
+            self.request.upload_errors[self.field_name] = message
+        self.parser = None
+        raise SkipFile(message)
+
+    def check_header(self, raw_data, start):
+        try:
+            self.parser.feed(raw_data)
+        except Exception:
+            self.reject('Загрузите правильное изображение.')
+        image = self.parser.image
+        if image is None:
+            if start + len(raw_data) > HEADER_LIMIT:
+                self.reject('Загрузите правильное изображение.')
+            return
+        self.header_checked = True
+        self.parser = None
+        if image.format not in settings.IMAGE_UPLOAD_FORMATS:
+            self.reject(f'Формат {image.format} не поддерживается.')
+        width, height = image.size
+        if width * height > settings.MAX_IMAGE_PIXELS:
+            self.reject(f'Слишком большое изображение: {width}×{height}.')
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.MAX_IMAGE_UPLOAD_SIZE:
+            self.reject(self.too_large())
+        if not self.header_checked:
+            self.check_header(raw_data, start)
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 app_name = 'posts'
 
@@ -11,6 +11,12 @@ urlpatterns = [
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
+    path('posts/<int:post_id>/comments/',
+         views.post_comments, name='post_comments'),
+    path('posts/<int:post_id>/comments/live/',
+         views.post_comments_live, name='post_comments_live'),
+    path('posts/<int:post_id>/comments/latest/',
+         views.post_comments_latest, name='post_comments_latest'),
     path('posts/<int:post_id>/comment/',
          views.add_comment, name='add_comment'),
     path('follow/', views.follow_index, name='follow_index'),
@@ -24,4 +30,18 @@ urlpatterns = [
         views.profile_unfollow,
         name='profile_unfollow'
     ),
+    path('api/v1/posts/', api.index, name='api_index'),
+    path('api/v1/posts/new/', api.index_new, name='api_index_new'),
+    path('api/v1/posts/<int:post_id>/',
+         api.post_detail, name='api_post_detail'),
+    path('api/v1/posts/<int:post_id>/comments/',
+         api.post_comments, name='api_post_comments'),
+    path('api/v1/group/<slug:slug>/', api.group_posts, name='api_group'),
+    path('api/v1/group/<slug:slug>/new/',
+         api.group_new, name='api_group_new'),
+    path('api/v1/profile/<str:username>/',
+         api.profile, name='api_profile'),
+    path('api/v1/follow/', api.follow_index, name='api_follow'),
+    path('api/v1/follow/new/', api.follow_new, name='api_follow_new'),
+    path('api/v1/follow/bulk/', api.follow_bulk, name='api_follow_bulk'),
 ]
@@ -1,9 +1,181 @@
+import base64
+import binascii
+import hashlib
+
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from .caching import current_generation
+
+# Наибольший id, который помещается в 64-битный INTEGER базы.
+MAX_ID = 2 ** 63 - 1
+
+
+def encode_cursor(obj, keys=('pub_date', 'pk')):
+    date_key, id_key = keys
+    raw = f'{getattr(obj, date_key).isoformat()}|{getattr(obj, id_key)}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (pub_date, id) из токена или None, если токен битый."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        pub_date, pk = raw.decode().split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    # Наивную дату нельзя сравнить с pub_date, а id вне INTEGER не
+    # примет база: такие токены тоже битые.
+    if pub_date is None or timezone.is_naive(pub_date):
+        return None
+    if not 0 <= pk <= MAX_ID:
+        return None
+    return pub_date, pk
+
+
+class CursorPage(Page):
+    """Страница ключевой пагинации: знает соседей, но не общее число."""
+
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<Cursor page>'
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return encode_cursor(self.object_list[-1], self.paginator.keys)
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return encode_cursor(self.object_list[0], self.paginator.keys)
+        return None
 
 
-def page_help(posts, request):
-    paginator = Paginator(posts, settings.COUNT_POSTS)
+class CursorPaginator(Paginator):
+    """Пагинация по (pub_date, id) без COUNT(*) и OFFSET.
+
+    Стоимость страницы не зависит от глубины: каждая страница — это
+    диапазонное чтение по индексу от позиции курсора. keys задаёт поля
+    даты и идентификатора, по которым строится курсор; descending —
+    порядок страниц (по умолчанию новые первыми).
+    """
+
+    def __init__(self, object_list, per_page, keys=('pub_date', 'pk'),
+                 descending=True, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.keys = keys
+        self.descending = descending
+
+    def key_filter(self, pub_date, pk, lookup):
+        date_key, id_key = self.keys
+        return (Q(**{f'{date_key}__{lookup}': pub_date})
+                | Q(**{date_key: pub_date, f'{id_key}__{lookup}': pk}))
+
+    def get_page(self, after=None, before=None):
+        date_key, id_key = self.keys
+        forward = [date_key, id_key]
+        backward = [f'-{date_key}', f'-{id_key}']
+        after_lookup, before_lookup = 'gt', 'lt'
+        if self.descending:
+            forward, backward = backward, forward
+            after_lookup, before_lookup = before_lookup, after_lookup
+        per_page = self.per_page
+        if before is not None and decode_cursor(before) is not None:
+            rows = list(
+                self.object_list.filter(
+                    self.key_filter(*decode_cursor(before), before_lookup)
+                ).order_by(*backward)[:per_page + 1]
+            )
+            has_previous = len(rows) > per_page
+            rows = rows[:per_page][::-1]
+            return CursorPage(rows, self, True, has_previous)
+        queryset = self.object_list.order_by(*forward)
+        has_previous = False
+        if after is not None and decode_cursor(after) is not None:
+            queryset = queryset.filter(
+                self.key_filter(*decode_cursor(after), after_lookup))
+            has_previous = True
+        rows = list(queryset[:per_page + 1])
+        return CursorPage(rows[:per_page], self, len(rows) > per_page,
+                          has_previous)
+
+
+class FeedPaginator(Paginator):
+    """Номерная пагинация с кэшируемым числом постов.
+
+    count_func позволяет посчитать посты дешевле, чем COUNT(*) по самому
+    queryset. Результат хранится в кэше в пределах поколения контента
+    (см. caching), так что одна лента пересчитывается не чаще одного
+    раза между изменениями и не реже раза в PAGINATOR_COUNT_CACHE_TIMEOUT.
+    """
+
+    def __init__(self, object_list, per_page, count_func=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_func = count_func
+
+    def _exact_count(self):
+        if self.count_func is not None:
+            return self.count_func()
+        return super().count
+
+    @cached_property
+    def count(self):
+        timeout = settings.PAGINATOR_COUNT_CACHE_TIMEOUT
+        if not timeout:
+            return self._exact_count()
+        query = str(self.object_list.query).encode()
+        key = 'feed_count:{}:{}'.format(
+            current_generation(), hashlib.md5(query).hexdigest())
+        count = cache.get(key)
+        if count is None:
+            count = self._exact_count()
+            cache.set(key, count, timeout)
+        return count
+
+
+def page_help(posts, request, keys=('pub_date', 'pk'), count=None):
+    """Страница ленты: номерная или курсорная.
+
+    count — необязательная функция, возвращающая число постов, если его
+    можно посчитать дешевле, чем COUNT(*) по самому queryset.
+    """
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    use_cursor = after or before or (
+        settings.CURSOR_PAGINATION and 'page' not in request.GET)
+    if use_cursor:
+        paginator = CursorPaginator(posts, settings.COUNT_POSTS, keys)
+        return paginator.get_page(after=after, before=before)
+    paginator = FeedPaginator(posts, settings.COUNT_POSTS, count)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     return page_obj
+
+
+def comments_page(comments, request):
+    """Комментарии по порядку, пачками от курсора ?after."""
+    paginator = CursorPaginator(
+        comments, settings.COUNT_COMMENTS, ('created', 'pk'),
+        descending=False)
+    return paginator.get_page(after=request.GET.get('after'))
@@ -1,25 +1,36 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render, redirect
-from django.views.decorators.cache import cache_page
+from django.urls import reverse
+from django.views.decorators.http import condition, require_safe
 
+from core.throttling import client_ip, throttle, too_many_requests
+
+from . import counters, graph, live, suggestions, thumbnails, timeline
+from .caching import cache_page_by_generation
+from .freshness import group_condition, post_condition, profile_condition
 from .forms import PostForm, CommentForm
 from .models import Group, Post, Follow
-from .utils import page_help
+from .utils import MAX_ID, comments_page, encode_cursor, page_help
 
 
-@cache_page(20 * 50)
+@cache_page_by_generation
 def index(request):
-    posts = Post.objects.all()
+    posts = Post.objects.select_related('author', 'group')
     page_obj = page_help(posts, request)
     context = {'page_obj': page_obj}
 
     return render(request, 'posts/index.html', context)
 
 
+@group_condition
+@cache_page_by_generation
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
+    posts = group.posts.select_related('author', 'group')
     page_obj = page_help(posts, request)
     context = {
         'page_obj': page_obj,
@@ -28,45 +39,103 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@profile_condition
+@cache_page_by_generation
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    stats = counters.stats_for(author)
+    posts = author.posts.select_related('author', 'group')
     page_obj = page_help(posts, request)
-    if request.user.is_authenticated:
-        following = Follow.objects.filter(
-            user=request.user, author=author
-        ).exists()
-    else:
-        following = False
+    following = graph.is_following(request.user.pk, author.pk)
     context = {'author': author,
                'page_obj': page_obj,
-               'following': following}
+               'stats': stats,
+               'following': following,
+               'suggested': suggestions.similar_to(author)}
     return render(request, 'posts/profile.html', context)
 
 
+@post_condition
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id)
     form = CommentForm(request.POST or None)
-    comments = post.comments.all()
+    comments = comments_page(post.comments.select_related('author'), request)
+    thumbs = thumbnails.urls_for([post.image.name]).get(post.image.name)
     context = {'post': post,
+               'thumbs': thumbs,
+               'author_stats': counters.stats_for(post.author),
                'comments': comments,
+               'live_stream': settings.LIVE_COMMENTS_STREAM,
                'form': form,
                }
     return render(request, 'posts/post_detail.html', context)
 
 
+@post_condition
+def post_comments(request, post_id):
+    post = get_object_or_404(Post, pk=post_id)
+    comments = post.comments.select_related('author')
+    since = request.GET.get('since', '')
+    # id вне INTEGER базы — обычная страница, а не ошибка.
+    if since.isdigit() and int(since) <= MAX_ID:
+        # Опрос новых комментариев: всё после последнего показанного.
+        comments = comments.filter(pk__gt=int(since)).order_by(
+            'pk')[:settings.COUNT_COMMENTS]
+    else:
+        comments = comments_page(comments, request)
+    context = {'post': post, 'comments': comments}
+    return render(request, 'posts/includes/comments.html', context)
+
+
+@require_safe
+@condition(etag_func=lambda request, post_id: str(live.latest(post_id)))
+def post_comments_latest(request, post_id):
+    # Ни сессии, ни пользователя: опрос стоит одно чтение кэша.
+    return JsonResponse({'latest': live.latest(post_id)})
+
+
+@require_safe
+def post_comments_live(request, post_id):
+    if not settings.LIVE_COMMENTS_STREAM:
+        raise Http404
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    since = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('since')
+    try:
+        last_id = int(since)
+    except (TypeError, ValueError):
+        last_id = None
+    if last_id is None or not 0 <= last_id <= MAX_ID:
+        last_id = live.latest(post.pk)
+    events = live.open_stream(post.pk, last_id, client_ip(request))
+    if events is None:
+        return too_many_requests(settings.LIVE_COMMENTS_RETRY // 1000)
+    response = StreamingHttpResponse(
+        events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx не должен копить события в буфере.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
+@throttle('post_create')
+@transaction.atomic
 def post_create(request):
-    form = PostForm(request.POST or None, files=request.FILES or None)
+    form = PostForm(request.POST or None, files=request.FILES or None,
+                    upload_errors=getattr(request, 'upload_errors', None))
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        thumbnails.schedule(post)
         return redirect('posts:profile', post.author.username)
     return render(request, 'posts/create_post.html', {'form': form})
 
 
 @login_required
+@transaction.atomic
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     if post.author != request.user:
@@ -74,14 +143,19 @@ def post_edit(request, post_id):
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
-        instance=post)
+        instance=post,
+        upload_errors=getattr(request, 'upload_errors', None))
     if form.is_valid():
-        form.save()
+        post = form.save()
+        if 'image' in form.changed_data:
+            thumbnails.schedule(post)
         return redirect('posts:post_detail', post_id)
     return render(request, 'posts/create_post.html', {'form': form})
 
 
 @login_required
+@throttle('add_comment')
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -90,19 +164,36 @@ def add_comment(request, post_id):
         comment.author = request.user
         comment.post = post
         comment.save()
+        if post.comments_count >= settings.COUNT_COMMENTS:
+            # Новый комментарий не на первой пачке: открываем ту, что
+            # с него начинается.
+            previous = post.comments.filter(
+                created__lt=comment.created).order_by(
+                '-created', '-pk').first()
+            if previous is not None:
+                return redirect(
+                    reverse('posts:post_detail', args=(post_id,))
+                    + f'?after={encode_cursor(previous, ("created", "pk"))}'
+                    + '#comments')
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
+@cache_page_by_generation
 def follow_index(request):
-    post_list = Post.objects.filter(
-        author__following__user=request.user).select_related('author', 'group')
-    page_obj = page_help(post_list, request)
-    context = {'page_obj': page_obj}
+    post_list = timeline.feed_for(request.user).select_related(
+        'author', 'group')
+    page_obj = page_help(
+        post_list, request, timeline.CURSOR_KEYS,
+        count=lambda: timeline.feed_count(request.user))
+    context = {'page_obj': page_obj,
+               'suggested': suggestions.for_user(request.user)}
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
+@throttle('follow', methods=('GET', 'POST'))
+@transaction.atomic
 def profile_follow(request, username):
     user = request.user
     author = get_object_or_404(User, username=username)
@@ -112,6 +203,8 @@ def profile_follow(request, username):
 
 
 @login_required
+@throttle('follow', methods=('GET', 'POST'))
+@transaction.atomic
 def profile_unfollow(request, username):
     # Дизлайк, отписка
     author = get_object_or_404(User, username=username)
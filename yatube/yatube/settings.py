@@ -1,4 +1,5 @@
 import os
+import sys
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -96,6 +97,83 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
 COUNT_POSTS = 10
 
+COUNT_COMMENTS = 20
+
+# Поток новых комментариев (posts.live). Каждый поток держит рабочий
+# поток сервера, поэтому включать его стоит только там, где сервер
+# умеет держать простаивающие соединения; иначе страница опрашивает
+# дешёвый адрес с id последнего комментария.
+LIVE_COMMENTS_STREAM = False
+
+LIVE_COMMENTS_MAX_STREAMS = 50
+
+LIVE_COMMENTS_MAX_STREAMS_PER_IP = 2
+
+# Сколько держать соединение, как часто опрашивать кэш и слать пинг,
+# через сколько миллисекунд браузеру переподключаться.
+LIVE_COMMENTS_TIMEOUT = 60 * 5
+
+LIVE_COMMENTS_POLL = 1
+
+LIVE_COMMENTS_PING = 15
+
+LIVE_COMMENTS_RETRY = 3000
+
+TIMELINE_BATCH_SIZE = 1000
+
+FOLLOW_BULK_LIMIT = 1000
+
+FOLLOW_GRAPH_TIMEOUT = 60 * 60 * 24
+
+# Сколько авторов предлагать и со сколькими похожими авторами
+# сравнивать каждого при пересчёте (build_suggestions).
+SUGGESTIONS_COUNT = 5
+
+SUGGESTIONS_NEIGHBOURS = 50
+
+CURSOR_PAGINATION = False
+
+PAGINATOR_ON_EACH_SIDE = 3
+
+PAGINATOR_COUNT_CACHE_TIMEOUT = 60 * 5
+
+# Ведра токенов core.throttling: (ёмкость, за сколько секунд ведро
+# наполняется целиком) для IP-адреса и для пользователя.
+THROTTLE_RATES = {
+    'post_create': {'ip': (30, 60 * 10), 'user': (10, 60 * 10)},
+    'add_comment': {'ip': (60, 60), 'user': (20, 60)},
+    'follow': {'ip': (120, 60), 'user': (60, 60)},
+    'follow_bulk': {'ip': (20, 60), 'user': (5, 60)},
+}
+
+# Больше стольких новых постов не считаем: клиенту хватит «100+».
+NEW_POSTS_LIMIT = 100
+
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Потоки, которые строят миниатюры постов. При 0 миниатюры строятся
+# сразу после фиксации транзакции; так идут тесты, чтобы фоновые
+# задачи не писали в MEDIA_ROOT после конца теста.
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+
+THUMBNAIL_WORKERS = 0 if TESTING else 2
+
+THUMBNAIL_KVSTORE = 'posts.kvstore.KVStore'
+
+FILE_UPLOAD_HANDLERS = [
+    'posts.uploads.ImageUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+MAX_IMAGE_UPLOAD_SIZE = 10 * 1024 * 1024
+
+MAX_IMAGE_PIXELS = 40_000_000
+
+IMAGE_UPLOAD_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+
 LOGIN_URL = 'users:login'
 
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -109,6 +187,14 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Кто отдаёт байты медиафайлов: None — сам Django (FileResponse),
+# 'nginx' — X-Accel-Redirect на internal-локацию MEDIA_ACCEL_PREFIX,
+# 'sendfile' — X-Sendfile с полным путём (Apache, lighttpd).
+MEDIA_ACCEL = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+MEDIA_SERVE_PREFIXES = ('posts/', 'cache/')
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',